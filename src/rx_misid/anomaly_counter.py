@@ -0,0 +1,112 @@
+'''
+Module with AnomalyCounter class
+'''
+import numpy
+import pandas as pnd
+
+from dmu.logging.log_store   import LogStore
+from rx_misid.efficiency_map import EfficiencyMap
+
+log=LogStore.add_logger('rx_misid:anomaly_counter')
+# ------------------------------
+class AnomalyCounter:
+    '''
+    Class meant to count, during weighting, candidates with:
+
+    below_map/above_map: Coordinates outside the map, moved to its edges
+    nan/negative/above_one: Efficiencies read from cells of the map that were fixed when loading it
+    zero_denominator: Efficiency in the control region equal to zero, i.e. weight cannot be calculated
+
+    The counts are kept per block, hadron, region and variable, where variable is:
+
+    - The name of the coordinate, for candidates outside the map
+    - The lepton, e.g. L1, for efficiencies from fixed cells
+    - The kind, e.g. PassFail, for zero denominators
+    '''
+    l_column = ['block', 'hadron', 'region', 'variable', 'category']
+    # ------------------------------
+    def __init__(self):
+        self._d_count : dict[tuple[int,str,str,str,str],int] = {}
+    # ------------------------------
+    def add(
+            self,
+            block    : int,
+            hadron   : str,
+            region   : str,
+            variable : str,
+            category : str,
+            count    : int) -> None:
+        '''
+        Adds `count` candidates to the given category
+        '''
+        if count == 0:
+            return
+
+        key = int(block), hadron, region, variable, category
+        self._d_count[key] = self._d_count.get(key, 0) + int(count)
+    # ------------------------------
+    def add_flags(
+            self,
+            block    : int,
+            hadron   : str,
+            region   : str,
+            variable : str,
+            arr_flag : numpy.ndarray) -> None:
+        '''
+        Adds candidates whose efficiencies come from fixed cells
+
+        Parameters
+        ----------------
+        arr_flag: Array with flags of the cells of the map associated to each candidate, see EfficiencyMap
+        '''
+        nfix     = len(EfficiencyMap.l_fix)
+        arr_count= numpy.bincount(arr_flag.ravel(), minlength=nfix + 1)
+        for index, category in enumerate(EfficiencyMap.l_fix):
+            self.add(
+                    block   = block,
+                    hadron  = hadron,
+                    region  = region,
+                    variable= variable,
+                    category= category,
+                    count   = arr_count[index + 1])
+    # ------------------------------
+    def merge(self, other : 'AnomalyCounter') -> None:
+        '''
+        Adds counts from other counter to this one
+        '''
+        for key, count in other._d_count.items():
+            self._d_count[key] = self._d_count.get(key, 0) + count
+    # ------------------------------
+    def to_df(self) -> pnd.DataFrame:
+        '''
+        Returns
+        ----------------
+        Dataframe with one row per block, hadron, region, variable and category and
+        a `count` column
+        '''
+        l_row = [ list(key) + [count] for key, count in sorted(self._d_count.items()) ]
+        df    = pnd.DataFrame(l_row, columns=self.l_column + ['count'])
+
+        return df
+    # ------------------------------
+    def log_summary(self) -> None:
+        '''
+        Logs one line per category with the total number of candidates
+        '''
+        d_total : dict[str,int] = {}
+        for key, count in self._d_count.items():
+            category          = key[-1]
+            d_total[category] = d_total.get(category, 0) + count
+
+        for category, count in sorted(d_total.items()):
+            log.info(f'{category:<20}{count:<10}')
+    # ------------------------------
+    def save(self, path : str) -> None:
+        '''
+        Saves counts to JSON file
+        '''
+        df = self.to_df()
+        df.to_json(path, orient='records', indent=2)
+
+        log.info(f'Saved anomalies to: {path}')
+# ------------------------------
@@ -0,0 +1,100 @@
+'''
+Module with functions meant to calculate MC candidate efficiencies in the signal
+and control regions from the four lepton efficiencies, in a single pass.
+
+If numba is installed, the pass is compiled, otherwise NumPy is used.
+'''
+import numpy
+
+from dmu.logging.log_store  import LogStore
+
+try:
+    import numba
+except ModuleNotFoundError:
+    numba = None
+
+log=LogStore.add_logger('rx_misid:efficiency_kernel')
+# ------------------------------
+def combine(
+        eff_p1 : numpy.ndarray,
+        eff_p2 : numpy.ndarray,
+        eff_f1 : numpy.ndarray,
+        eff_f2 : numpy.ndarray) -> tuple[numpy.ndarray,numpy.ndarray]:
+    '''
+    Parameters
+    ---------------
+    eff_xy: Efficiency for lepton y (1 or 2) in signal (x=p) or control (x=f) region
+
+    Returns
+    ---------------
+    Tuple with candidate efficiencies for the signal and control regions
+    '''
+    eff_sig = eff_p1 * eff_p2
+    eff_ctr = eff_p1 * eff_f2 + eff_p2 * eff_f1 + eff_f1 * eff_f2
+
+    return eff_sig, eff_ctr
+# ------------------------------
+def _gather_numpy(
+        sig_values : numpy.ndarray,
+        ctr_values : numpy.ndarray,
+        sig_index  : tuple[numpy.ndarray,...],
+        ctr_index  : tuple[numpy.ndarray,...]) -> tuple[numpy.ndarray,numpy.ndarray]:
+    six1, siy1, six2, siy2 = sig_index
+    cix1, ciy1, cix2, ciy2 = ctr_index
+
+    eff_p1 = sig_values[..., six1, siy1]
+    eff_p2 = sig_values[..., six2, siy2]
+    eff_f1 = ctr_values[..., cix1, ciy1]
+    eff_f2 = ctr_values[..., cix2, ciy2]
+
+    return combine(eff_p1, eff_p2, eff_f1, eff_f2)
+# ------------------------------
+def _gather_loop(sig_values, ctr_values, six1, siy1, six2, siy2, cix1, ciy1, cix2, ciy2):
+    '''
+    Same as `_gather_numpy` written as a loop over candidates, meant to be compiled with numba
+    '''
+    nentries = len(six1)
+    eff_sig  = numpy.empty(nentries)
+    eff_ctr  = numpy.empty(nentries)
+    for i in range(nentries):
+        eff_p1 = sig_values[six1[i], siy1[i]]
+        eff_p2 = sig_values[six2[i], siy2[i]]
+        eff_f1 = ctr_values[cix1[i], ciy1[i]]
+        eff_f2 = ctr_values[cix2[i], ciy2[i]]
+
+        eff_sig[i] = eff_p1 * eff_p2
+        eff_ctr[i] = eff_p1 * eff_f2 + eff_p2 * eff_f1 + eff_f1 * eff_f2
+
+    return eff_sig, eff_ctr
+
+_gather_numba = None if numba is None else numba.njit(cache=True)(_gather_loop)
+# ------------------------------
+def get_region_efficiencies(
+        sig_values : numpy.ndarray,
+        ctr_values : numpy.ndarray,
+        sig_index  : tuple[numpy.ndarray,...],
+        ctr_index  : tuple[numpy.ndarray,...],
+        use_numba  : bool = True) -> tuple[numpy.ndarray,numpy.ndarray]:
+    '''
+    Parameters
+    ---------------
+    sig_values: Array of efficiencies from signal region map, with shape (nx, ny), or (ntoys, nx, ny) for toys
+    ctr_values: Array of efficiencies from control region map, with same shape
+    sig_index : Tuple with bin indices (ix1, iy1, ix2, iy2) of leptons 1 and 2 in the signal region map
+    ctr_index : Same as above for control region map, it can be the same object if the binning is the same
+    use_numba : If True (default) and numba is installed, will use compiled loop
+
+    Returns
+    ---------------
+    Tuple with arrays of candidate efficiencies in signal and control region, with shape (ncandidates,)
+    or (ntoys, ncandidates)
+    '''
+    if use_numba and _gather_numba is not None and sig_values.ndim == 2:
+        return _gather_numba(sig_values, ctr_values, *sig_index, *ctr_index)
+
+    return _gather_numpy(
+            sig_values = sig_values,
+            ctr_values = ctr_values,
+            sig_index  = sig_index,
+            ctr_index  = ctr_index)
+# ------------------------------
@@ -0,0 +1,154 @@
+'''
+Module with EfficiencyMap class
+'''
+import numpy
+
+from boost_histogram        import Histogram    as bh
+from dmu.logging.log_store  import LogStore
+
+log=LogStore.add_logger('rx_misid:efficiency_map')
+# ------------------------------
+class EfficiencyMap:
+    '''
+    Class meant to hold a 2D PID efficiency map as dense NumPy arrays:
+
+    - Contiguous array of efficiency values, sanitized, i.e. in [0, 1]
+    - Contiguous array of variances of the efficiencies
+    - Arrays with the bin edges along x and y
+    - Array of flags, marking the cells that had to be fixed during sanitation
+
+    The flag of a cell is 0 if it was not fixed, otherwise it is the index
+    in `l_fix` of the kind of fix, plus one.
+    '''
+    l_fix = ['nan', 'negative', 'above_one']
+    # ------------------------------
+    def __init__(
+            self,
+            values    : numpy.ndarray,
+            variances : numpy.ndarray,
+            x_edges   : numpy.ndarray,
+            y_edges   : numpy.ndarray,
+            flags     : numpy.ndarray):
+        '''
+        values   : Array of efficiencies with shape (nx, ny), expected to be already sanitized
+        variances: Array of variances of the efficiencies, with the same shape
+        x_edges  : Array with nx + 1 bin edges along x
+        y_edges  : Array with ny + 1 bin edges along y
+        flags    : Array of integers with the same shape, marking the cells fixed during sanitation
+        '''
+        self._values    = values
+        self._variances = variances
+        self._l_edges   = [x_edges, y_edges]
+        self._flags     = flags
+    # ------------------------------
+    @classmethod
+    def from_hist(cls, hist : bh, name : str) -> 'EfficiencyMap':
+        '''
+        Parameters
+        ----------------
+        hist: Boost histogram with efficiencies, as made by PIDCalib2
+        name: Identifier of map, used for logging
+
+        Returns
+        ----------------
+        Instance of EfficiencyMap, where NaN and negative efficiencies are replaced with zeros
+        and efficiencies above one are replaced with ones
+        '''
+        if hist.ndim != 2:
+            raise NotImplementedError(f'Only 2D maps supported, found {hist.ndim} dimensions in {name}')
+
+        values    = numpy.array(hist.values(), dtype=numpy.float64, order='C')
+        variances = hist.variances()
+        if variances is None:
+            log.debug(f'No variances found for {name}, using zeros')
+            variances = numpy.zeros_like(values)
+        else:
+            variances = numpy.array(variances, dtype=numpy.float64, order='C')
+
+        flags  = numpy.zeros(values.shape, dtype=numpy.int8)
+        flags[numpy.isnan(values)] = 1 + cls.l_fix.index('nan')
+        flags[values < 0         ] = 1 + cls.l_fix.index('negative')
+        flags[values > 1         ] = 1 + cls.l_fix.index('above_one')
+
+        nfixed = numpy.count_nonzero(flags)
+        if nfixed > 0:
+            log.debug(f'Fixed {nfixed}/{values.size} cells in {name}')
+
+        values = numpy.nan_to_num(values, nan=0.0)
+        values = numpy.clip(values, 0.0, 1.0)
+
+        x_edges = numpy.array(hist.axes[0].edges, dtype=numpy.float64)
+        y_edges = numpy.array(hist.axes[1].edges, dtype=numpy.float64)
+
+        return cls(
+                values   = values,
+                variances= variances,
+                x_edges  = x_edges,
+                y_edges  = y_edges,
+                flags    = flags)
+    # ------------------------------
+    @property
+    def values(self) -> numpy.ndarray:
+        '''
+        Array of sanitized efficiencies with shape (nx, ny)
+        '''
+        return self._values
+    # ------------------------------
+    @property
+    def variances(self) -> numpy.ndarray:
+        '''
+        Array of variances of efficiencies with shape (nx, ny)
+        '''
+        return self._variances
+    # ------------------------------
+    @property
+    def flags(self) -> numpy.ndarray:
+        '''
+        Array of flags with shape (nx, ny), see class docstring
+        '''
+        return self._flags
+    # ------------------------------
+    @property
+    def fixed(self) -> dict[str,int]:
+        '''
+        Dictionary with the number of cells fixed, per kind of fix (nan, negative, above_one)
+        '''
+        d_fixed = {}
+        for index, fix in enumerate(self.l_fix):
+            d_fixed[fix] = int(numpy.count_nonzero(self._flags == index + 1))
+
+        return d_fixed
+    # ------------------------------
+    def get_toys(self, ntoys : int, rng : numpy.random.Generator) -> numpy.ndarray:
+        '''
+        Parameters
+        ---------------
+        ntoys: Number of replicas of the map
+        rng  : Random number generator
+
+        Returns
+        ---------------
+        Array with shape (ntoys, nx, ny) of efficiencies fluctuated with a Gaussian
+        whose width is the uncertainty of each cell, clipped to [0, 1]. Cells fixed during
+        sanitation, see `flags`, are not fluctuated
+        '''
+        arr_var = numpy.nan_to_num(self._variances, nan=0.0)
+        arr_sig = numpy.sqrt(numpy.clip(arr_var, 0.0, None))
+        arr_sig[self._flags != 0] = 0.0
+        arr_toy = self._values + rng.standard_normal((ntoys,) + self._values.shape) * arr_sig
+        arr_toy = numpy.clip(arr_toy, 0.0, 1.0)
+
+        return arr_toy
+    # ------------------------------
+    def edges(self, iaxis : int) -> numpy.ndarray:
+        '''
+        Parameters
+        ---------------
+        iaxis: 0 for x axis, 1 for y axis
+
+        Returns
+        ---------------
+        Array with bin edges
+        '''
+        return self._l_edges[iaxis]
+# ------------------------------
@@ -0,0 +1,315 @@
+'''
+Module with the executors used to run the tasks of the misID pipeline, e.g. one task per
+sample, charge and hadron. All of them provide the interface of `Executor`:
+
+- SerialExecutor : Runs the tasks one after the other in this process
+- ProcessExecutor: Runs the tasks in the pool of processes of WorkerPool
+- ThreadExecutor : Runs the tasks in a pool of threads
+- JoblibExecutor : Runs the tasks with joblib, by default with the loky backend, if joblib is installed
+- BatchExecutor  : Base class for executors that send the tasks as jobs to a batch system,
+                   SubprocessExecutor implements it with local processes
+'''
+import os
+import sys
+import time
+import shutil
+import pickle
+import tempfile
+import traceback
+import subprocess
+from abc                import ABC, abstractmethod
+from collections.abc    import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dmu.logging.log_store  import LogStore
+from rx_misid.worker_pool   import WorkerPool
+
+try:
+    import joblib
+except ModuleNotFoundError:
+    joblib = None
+
+log=LogStore.add_logger('rx_misid:executor')
+# ------------------------------
+class Executor(ABC):
+    '''
+    Class meant to run a list of tasks, each of them a call to a function with a single, picklable,
+    argument. The function and the arguments need to be picklable for executors running outside this process
+    '''
+    # ------------------------------
+    def share_maps(self, l_path : list[str]) -> None:
+        '''
+        Parameters
+        -------------
+        l_path: List of paths to the maps that the tasks will use.
+                Executors can use this to load them once for all the tasks, by default nothing is done
+        '''
+        log.debug(f'Not sharing {len(l_path)} maps')
+    # ------------------------------
+    @abstractmethod
+    def map(self, func : Callable, l_arg : list) -> list:
+        '''
+        Parameters
+        -------------
+        func : Function taking one argument
+        l_arg: List of arguments
+
+        Returns
+        -------------
+        List of results, in the same order as the arguments
+        '''
+    # ------------------------------
+    def imap_unordered(self, func : Callable, l_arg : list) -> Iterator:
+        '''
+        Same as `map`, but returning an iterator over the results, which can be in any order.
+        By default the results are returned after all the tasks finish, in the order of the arguments
+        '''
+        yield from self.map(func, l_arg)
+# ------------------------------
+class SerialExecutor(Executor):
+    '''
+    Executor running the tasks one after the other, in this process
+    '''
+    # ------------------------------
+    def map(self, func : Callable, l_arg : list) -> list:
+        return [ func(arg) for arg in l_arg ]
+    # ------------------------------
+    def imap_unordered(self, func : Callable, l_arg : list) -> Iterator:
+        for arg in l_arg:
+            yield func(arg)
+# ------------------------------
+class ProcessExecutor(Executor):
+    '''
+    Executor running the tasks in the pool of processes that lives across calls, see WorkerPool
+    '''
+    # ------------------------------
+    def __init__(self, nproc : int):
+        '''
+        nproc: Number of processes
+        '''
+        self._nproc  = nproc
+        self._l_path : list[str] = []
+    # ------------------------------
+    def share_maps(self, l_path : list[str]) -> None:
+        '''
+        The maps are shared with the workers when the pool is started
+        '''
+        self._l_path = l_path
+    # ------------------------------
+    def map(self, func : Callable, l_arg : list) -> list:
+        pool = WorkerPool.get(nproc=self._nproc, l_path=self._l_path)
+
+        return pool.map(func, l_arg)
+    # ------------------------------
+    def imap_unordered(self, func : Callable, l_arg : list) -> Iterator:
+        pool = WorkerPool.get(nproc=self._nproc, l_path=self._l_path)
+
+        yield from pool.imap_unordered(func, l_arg)
+# ------------------------------
+class ThreadExecutor(Executor):
+    '''
+    Executor running the tasks in a pool of threads. Only useful when the tasks release the GIL,
+    e.g. while ROOT runs an event loop. ROOT.EnableThreadSafety() should be called before using it with ROOT
+    '''
+    # ------------------------------
+    def __init__(self, nthreads : int):
+        '''
+        nthreads: Number of threads
+        '''
+        self._nthreads = nthreads
+    # ------------------------------
+    def map(self, func : Callable, l_arg : list) -> list:
+        with ThreadPoolExecutor(max_workers=self._nthreads) as pool:
+            return list(pool.map(func, l_arg))
+    # ------------------------------
+    def imap_unordered(self, func : Callable, l_arg : list) -> Iterator:
+        with ThreadPoolExecutor(max_workers=self._nthreads) as pool:
+            l_fut = [ pool.submit(func, arg) for arg in l_arg ]
+            for fut in as_completed(l_fut):
+                yield fut.result()
+# ------------------------------
+class JoblibExecutor(Executor):
+    '''
+    Executor running the tasks with joblib. With the default loky backend the workers
+    are reused across calls, as with ProcessExecutor
+    '''
+    # ------------------------------
+    def __init__(self, nproc : int, backend : str = 'loky'):
+        '''
+        nproc  : Number of processes or threads
+        backend: joblib backend, e.g. loky (default), multiprocessing or threading
+        '''
+        if joblib is None:
+            raise ModuleNotFoundError('JoblibExecutor needs joblib, which is not installed')
+
+        self._nproc   = nproc
+        self._backend = backend
+    # ------------------------------
+    def map(self, func : Callable, l_arg : list) -> list:
+        parallel = joblib.Parallel(n_jobs=self._nproc, backend=self._backend)
+
+        return parallel(joblib.delayed(func)(arg) for arg in l_arg)
+# ------------------------------
+class BatchExecutor(Executor):
+    '''
+    Base class for executors that run each task as a job in a batch system. The tasks are
+    written to a directory, that has to be visible from the nodes, as pickle files. Each job
+    needs to run:
+
+    python -m rx_misid.executor /path/to/task_x.pkl
+
+    which writes the result next to the task. Implementations only need to provide `submit` and `wait`.
+    The directory is removed once all the results are collected, it is kept if any task failed
+    '''
+    # ------------------------------
+    def __init__(self, work_dir : str|None = None):
+        '''
+        work_dir: Directory where the directories with the tasks and results of each call to `map` are made.
+                  By default the system's temporary directory
+        '''
+        self._work_dir = work_dir
+    # ------------------------------
+    @abstractmethod
+    def submit(self, l_path : list[str]) -> None:
+        '''
+        Parameters
+        -------------
+        l_path: List of paths to pickle files with the tasks, a job has to be sent for each of them
+        '''
+    # ------------------------------
+    @abstractmethod
+    def wait(self) -> None:
+        '''
+        Blocks until all the jobs sent with `submit` finish
+        '''
+    # ------------------------------
+    def map(self, func : Callable, l_arg : list) -> list:
+        work_dir = tempfile.mkdtemp(prefix='misid_batch_', dir=self._work_dir)
+
+        # The jobs run in new processes, where the caching directory, the classes skipping the cache,
+        # the settings of RDFGetter and the logging levels are the defaults, they are passed with each task
+        state    = WorkerPool.get_state()
+
+        l_path   = []
+        for index, arg in enumerate(l_arg):
+            path = f'{work_dir}/task_{index:05d}.pkl'
+            with open(path, 'wb') as ofile:
+                pickle.dump((func, arg, state), ofile)
+
+            l_path.append(path)
+
+        log.info(f'Submitting {len(l_path)} tasks from: {work_dir}')
+        self.submit(l_path)
+        self.wait()
+
+        l_res = [ _load_result(path=path) for path in l_path ]
+        shutil.rmtree(work_dir)
+
+        return l_res
+# ------------------------------
+class SubprocessExecutor(BatchExecutor):
+    '''
+    Executor running each task as a job in a local process, meant to test
+    the batch interface and to run the jobs in the same way they run in a batch system
+    '''
+    # ------------------------------
+    def __init__(self, nproc : int, work_dir : str|None = None):
+        '''
+        nproc   : Maximum number of jobs running at the same time
+        work_dir: See BatchExecutor
+        '''
+        super().__init__(work_dir=work_dir)
+
+        self._nproc  = nproc
+        self._l_wait : list[str] = []
+    # ------------------------------
+    def submit(self, l_path : list[str]) -> None:
+        self._l_wait += l_path
+    # ------------------------------
+    def wait(self) -> None:
+        '''
+        Raises RuntimeError, once all the jobs finish, if any of them exited abnormally,
+        e.g. killed before writing its result
+        '''
+        l_proc   = []
+        l_failed = []
+        while len(self._l_wait) > 0 or len(l_proc) > 0:
+            l_failed += [ (path, proc.returncode) for path, proc in l_proc if proc.poll() not in (None, 0) ]
+            l_proc    = [ (path, proc)            for path, proc in l_proc if proc.returncode is None ]
+            while len(self._l_wait) > 0 and len(l_proc) < self._nproc:
+                path = self._l_wait.pop(0)
+                l_proc.append((path, subprocess.Popen([sys.executable, '-m', 'rx_misid.executor', path])))
+
+            time.sleep(0.1)
+
+        if len(l_failed) == 0:
+            return
+
+        for path, code in l_failed:
+            log.error(f'Job for task {path} exited with code {code}')
+
+        path, code = l_failed[0]
+        raise RuntimeError(f'{len(l_failed)} jobs exited abnormally, e.g. job for task {path} with code {code}')
+# ------------------------------
+def _get_result_path(path : str) -> str:
+    '''
+    Returns path to the file with the result of the task in `path`
+    '''
+    return path.replace('.pkl', '_result.pkl')
+# ------------------------------
+def _load_result(path : str):
+    '''
+    Parameters
+    -------------
+    path: Path to pickle file with task
+
+    Returns
+    -------------
+    Result of the task, raises if the task failed or did not run
+    '''
+    res_path = _get_result_path(path=path)
+    if not os.path.isfile(res_path):
+        raise FileNotFoundError(f'No result found for task: {path}')
+
+    with open(res_path, 'rb') as ifile:
+        is_ok, res = pickle.load(ifile)
+
+    if not is_ok:
+        raise RuntimeError(f'Task {path} failed with:\n{res}')
+
+    return res
+# ------------------------------
+def run_task(path : str) -> None:
+    '''
+    Runs task written by BatchExecutor and writes the result, or the traceback if it fails
+
+    Parameters
+    -------------
+    path: Path to pickle file with task
+    '''
+    with open(path, 'rb') as ifile:
+        func, arg, state = pickle.load(ifile)
+
+    WorkerPool.set_state(state=state)
+
+    try:
+        res = True, func(arg)
+    except Exception: # pylint: disable=broad-exception-caught
+        res = False, traceback.format_exc()
+
+    res_path = _get_result_path(path=path)
+    with open(f'{res_path}.tmp', 'wb') as ofile:
+        pickle.dump(res, ofile)
+
+    # Results appear only when fully written
+    os.replace(f'{res_path}.tmp', res_path)
+# ------------------------------
+def main():
+    '''
+    Runs the tasks passed as arguments, meant to be used by batch jobs
+    '''
+    for path in sys.argv[1:]:
+        run_task(path=path)
+# ------------------------------
+if __name__ == '__main__':
+    main()
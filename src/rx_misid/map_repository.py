@@ -0,0 +1,250 @@
+'''
+Module with MapRepository class
+'''
+import os
+import glob
+import pickle
+from contextlib                  import contextmanager
+from multiprocessing             import shared_memory
+
+import numpy
+from dmu.generic                 import hashing
+from dmu.logging.log_store       import LogStore
+from rx_misid.efficiency_map     import EfficiencyMap
+
+log=LogStore.add_logger('rx_misid:map_repository')
+# ------------------------------
+class MapRepository:
+    '''
+    Class meant to:
+
+    - Load PID efficiency maps once per process, keyed by path, modification time and size of the file.
+    Only the map of the latest version of each file is kept
+    - Publish the loaded maps through shared memory, such that worker processes can attach to them
+    instead of reading them again
+    '''
+    _d_map : dict[tuple[str,int,int],EfficiencyMap] = {}
+    _l_shm : list[shared_memory.SharedMemory]       = [] # Blocks made by this process
+    _l_att : list[shared_memory.SharedMemory]       = [] # Blocks made by other processes, attached by this one
+    _d_sum : dict[tuple[str,int,int],str]           = {} # Checksums of contents of files
+    # ------------------------------
+    @staticmethod
+    def _get_key(path : str) -> tuple[str,int,int]:
+        '''
+        Returns tuple with absolute path, modification time in ns and size of file
+        '''
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+
+        return path, stat.st_mtime_ns, stat.st_size
+    # ------------------------------
+    @staticmethod
+    def _drop_outdated(d_data : dict[tuple[str,int,int],object], key : tuple[str,int,int]) -> None:
+        '''
+        Removes from `d_data` the entries of the same file as `key`, made from other versions of it
+        '''
+        l_key = [ old_key for old_key in d_data if old_key[0] == key[0] and old_key != key ]
+        for old_key in l_key:
+            log.debug(f'Dropping outdated entry for: {key[0]}')
+            del d_data[old_key]
+    # ------------------------------
+    @staticmethod
+    def get_paths(pkl_dir : str) -> list[str]:
+        '''
+        Parameters
+        -------------
+        pkl_dir: Directory with pickle files storing maps
+
+        Returns
+        -------------
+        Sorted list of paths to maps
+        '''
+        l_path = glob.glob(f'{pkl_dir}/*.pkl')
+
+        return sorted(l_path)
+    # ------------------------------
+    @classmethod
+    def get_map(cls, path : str) -> EfficiencyMap:
+        '''
+        Parameters
+        -------------
+        path: Path to pickle file with boost histogram storing efficiencies
+
+        Returns
+        -------------
+        Efficiency map, loaded only if it was not already loaded
+        or the file changed since it was loaded
+        '''
+        key = cls._get_key(path)
+        if key in cls._d_map:
+            log.debug(f'Picking cached map: {path}')
+            return cls._d_map[key]
+
+        log.debug(f'Loading map: {path}')
+        with open(path, 'rb') as ifile:
+            try:
+                hist = pickle.load(ifile)
+            except EOFError as exc:
+                raise EOFError(f'Cannot open map: {path}') from exc
+
+        name = os.path.basename(path)
+        emap = EfficiencyMap.from_hist(hist=hist, name=name)
+
+        cls._drop_outdated(d_data=cls._d_map, key=key)
+        cls._d_map[key] = emap
+
+        return emap
+    # ------------------------------
+    @classmethod
+    def get_checksum(cls, l_path : list[str]) -> str:
+        '''
+        Parameters
+        -------------
+        l_path: List of paths to maps
+
+        Returns
+        -------------
+        Hash of the names and contents of the files. The content of each file is hashed
+        only if it was not already hashed or the file changed since it was hashed
+        '''
+        l_sum = []
+        for path in l_path:
+            key = cls._get_key(path)
+            if key not in cls._d_sum:
+                log.debug(f'Hashing map: {path}')
+                cls._drop_outdated(d_data=cls._d_sum, key=key)
+                cls._d_sum[key] = hashing.hash_file(path=path)
+
+            l_sum.append((os.path.basename(path), cls._d_sum[key]))
+
+        return hashing.hash_object(obj=l_sum)
+    # ------------------------------
+    @classmethod
+    def _share_map(cls, path : str) -> dict:
+        '''
+        Copies arrays of map into shared memory block
+
+        Returns
+        -------------
+        Dictionary with information needed to attach to the block
+        '''
+        key  = cls._get_key(path)
+        emap = cls.get_map(path)
+        shape= emap.values.shape
+        size = 2 * emap.values.nbytes
+
+        shm  = shared_memory.SharedMemory(create=True, size=size)
+        arr  = numpy.ndarray((2,) + shape, dtype=numpy.float64, buffer=shm.buf)
+        arr[0] = emap.values
+        arr[1] = emap.variances
+
+        cls._l_shm.append(shm)
+
+        return {
+                'key'     : key,
+                'name'    : shm.name,
+                'shape'   : shape,
+                'x_edges' : emap.edges(0),
+                'y_edges' : emap.edges(1),
+                'flags'   : emap.flags}
+    # ------------------------------
+    @classmethod
+    def share(cls, l_path : list[str]) -> list[dict]:
+        '''
+        Parameters
+        -------------
+        l_path: List of paths to maps
+
+        Returns
+        -------------
+        Manifest, i.e. list of dictionaries, one per map, with the information needed
+        by `attach` to access the maps in shared memory. Meant to be passed to the workers
+        '''
+        log.debug(f'Sharing {len(l_path)} maps')
+        l_info = [ cls._share_map(path) for path in l_path ]
+
+        return l_info
+    # ------------------------------
+    @classmethod
+    def attach(cls, manifest : list[dict]) -> None:
+        '''
+        Meant to be used as initializer of worker processes
+
+        Parameters
+        -------------
+        manifest: List of dictionaries, as returned by `share`
+        '''
+        for info in manifest:
+            key = tuple(info['key'])
+            if key in cls._d_map:
+                continue
+
+            shm = _attach_block(name=info['name'])
+            arr = numpy.ndarray((2,) + tuple(info['shape']), dtype=numpy.float64, buffer=shm.buf)
+            arr.flags.writeable = False
+
+            cls._l_att.append(shm)
+            cls._drop_outdated(d_data=cls._d_map, key=key)
+            cls._d_map[key] = EfficiencyMap(
+                    values    = arr[0],
+                    variances = arr[1],
+                    x_edges   = info['x_edges'],
+                    y_edges   = info['y_edges'],
+                    flags     = info['flags'])
+
+        log.debug(f'Attached to {len(manifest)} maps')
+    # ------------------------------
+    @classmethod
+    def clear(cls) -> None:
+        '''
+        Forgets the maps loaded or attached by this process and the checksums of their files,
+        such that they are read again when needed
+        '''
+        log.debug(f'Clearing {len(cls._d_map)} maps')
+
+        cls._d_map = {}
+        cls._d_sum = {}
+    # ------------------------------
+    @classmethod
+    def release(cls) -> None:
+        '''
+        Closes and removes shared memory blocks created by `share`
+        '''
+        for shm in cls._l_shm:
+            shm.close()
+            shm.unlink()
+
+        cls._l_shm = []
+    # ------------------------------
+    @classmethod
+    def shared(cls, l_path : list[str]):
+        '''
+        Context manager sharing maps, yielding the manifest and
+        releasing the shared memory blocks at the end
+
+        Parameters
+        -------------
+        l_path: List of paths to maps
+        '''
+        @contextmanager
+        def _context():
+            manifest = cls.share(l_path)
+            try:
+                yield manifest
+            finally:
+                cls.release()
+
+        return _context()
+# ------------------------------
+def _attach_block(name : str) -> shared_memory.SharedMemory:
+    '''
+    Attaches to existing shared memory block, without registering it
+    in the resource tracker, the block is owned by the process that made it
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before python 3.13 the block gets registered. Workers share the
+        # resource tracker of the parent, which unregisters it in `release`
+        return shared_memory.SharedMemory(name=name)
+# ------------------------------
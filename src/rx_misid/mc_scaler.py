@@ -1,6 +1,7 @@
 '''
 Module containing MCScaler class
 '''
+import time
 from typing                 import cast
 
 from ROOT                   import RDataFrame
@@ -8,6 +9,7 @@ from dmu.logging.log_store  import LogStore
 from dmu.generic            import hashing
 from dmu.workflow.cache     import Cache     as Wcache
 from dmu.generic            import utilities as gut
+from dmu.rdataframe         import utilities as ut
 
 from rx_selection           import selection as sel
 from rx_data.rdf_getter     import RDFGetter
@@ -66,10 +68,6 @@ class MCScaler(Wcache):
             log.debug(f'{cut_name:<20}{cut_expr}')
             rdf = rdf.Filter(cut_expr, cut_name)
 
-        if log.getEffectiveLevel() == 10:
-            rep = rdf.Report()
-            rep.Print()
-
         # After selection uid of dataframe needs to be updated
         uid     = hashing.hash_object(obj=[d_sel, uid])
         rdf.uid = uid
@@ -91,20 +89,46 @@ class MCScaler(Wcache):
         rdf_sig = rdf.Filter(sig_reg, 'Signal' )
         rdf_ctr = rdf.Filter(ctr_reg, 'Control')
 
-        if log.getEffectiveLevel() == 10:
-            rep_sig = rdf_sig.Report()
-            rep_ctr = rdf_ctr.Report()
+        # Everything is booked before the event loop runs, such that it runs once
+        cnt_sig = rdf_sig.Count()
+        cnt_ctr = rdf_ctr.Count()
+        rep_sig = rdf_sig.Report()
+        rep_ctr = rdf_ctr.Report()
+
+        start   = time.perf_counter()
+        nctr    = cnt_ctr.GetValue()
+        nsig    = cnt_sig.GetValue()
+        elapsed = time.perf_counter() - start
 
+        if log.getEffectiveLevel() == 10:
             log.debug('Signal:')
             rep_sig.Print()
             log.debug('Control:')
             rep_ctr.Print()
 
-        nctr = rdf_ctr.Count().GetValue()
-        nsig = rdf_sig.Count().GetValue()
+        self._save_cutflow(d_rep={'signal' : rep_sig, 'control' : rep_ctr}, elapsed=elapsed)
 
         return nsig, nctr
     # ----------------------------------
+    def _save_cutflow(self, d_rep : dict, elapsed : float) -> None:
+        '''
+        Saves JSON file with pass counts of each filter and time spent in the event loop
+
+        Parameters
+        ---------------
+        d_rep  : Dictionary mapping region to its filled cutflow report
+        elapsed: Time in seconds spent in the event loop
+        '''
+        d_cutflow = {}
+        for region, rep in d_rep.items():
+            df_cut            = ut.rdf_report_to_df(rep)
+            d_cutflow[region] = df_cut[['cut', 'All', 'Passed']].to_dict(orient='records')
+
+        log.info(f'Event loop for {self._sample} took {elapsed:.1f} s')
+
+        data = {'sample' : self._sample, 'time' : elapsed, 'cutflow' : d_cutflow}
+        gut.dump_json(data, f'{self._out_path}/cutflow.json', exists_ok=True)
+    # ----------------------------------
     def _get_ratio(self, nsig_dt : float, nsig_mc : float) -> float:
         '''
         Parameters
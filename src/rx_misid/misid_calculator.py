@@ -1,25 +1,37 @@
 '''
 Module holding MisIDCalculator class
 '''
+import os
+import copy
+import inspect
+from collections.abc import Callable
 
-from multiprocessing import Pool
-
+import numpy
 import pandas as pnd
 
-from ROOT                     import RDataFrame
+from ROOT                     import RDataFrame, TFile, TChain
 from dmu.logging.log_store    import LogStore
 from dmu.generic              import hashing
 from dmu.generic              import utilities as gut
 from dmu.pdataframe           import utilities as put
+from dmu.workflow.cache       import Cache     as Wcache
 
 from rx_selection             import selection as sel
 from rx_data.rdf_getter       import RDFGetter
+from rx_misid                 import efficiency_map
+from rx_misid                 import efficiency_kernel
+from rx_misid                 import map_repository
 from rx_misid.sample_splitter import SampleSplitter
 from rx_misid.sample_weighter import SampleWeighter
+from rx_misid.map_repository  import MapRepository
+from rx_misid.executor        import Executor, SerialExecutor, ProcessExecutor
+from rx_misid.worker_pool     import WorkerPool
 
 log=LogStore.add_logger('rx_misid:misid_calculator')
+# The workers need the same settings of RDFGetter, e.g. max_entries or custom_columns
+WorkerPool.track(RDFGetter)
 # ----------------------------
-class MisIDCalculator:
+class MisIDCalculator(Wcache):
     '''
     Class meant to provide a dataframe for a given sample among:
 
@@ -27,7 +39,8 @@ class MisIDCalculator:
     Signal
     Leakage
 
-    In either the signal or the control region
+    In either the signal or the control region.
+    The weighted dataframe is cached, see `get_misid`
     '''
     # -----------------------------
     def __init__(
@@ -35,20 +48,64 @@ class MisIDCalculator:
             cfg    : dict,
             is_sig : bool):
         '''
-        cfg   : Dictionary with configuration
+        cfg   : Dictionary with configuration. If `q2bin` in the `input` section is a list of q2 bins,
+                the selection common to all the bins is applied once and the candidates are labelled
+                with the bins they belong to, see `get_misid_q2bins`
         is_sig: If true/false, provides dataframes with weights to transfer sample to signal/contrl region
         '''
-        self._cfg   =    cfg
+        self._cfg   = self._add_q2_branches(cfg=cfg)
         self._is_sig= is_sig
+        # Identifiers of the input files, before the selection, found once per instance, see `_get_rdfs`
+        self._d_uid : dict[str,str] = {}
+        self._uid   : str|None      = None
+
+        sample = self._cfg['input']['sample']
+        q2bin  = self._cfg['input']['q2bin']
+        q2bin  = q2bin if isinstance(q2bin, str) else '_'.join(q2bin)
+
+        # Calculators with different configs, e.g. variants of the selection, can run at the same time
+        # and need their own output directories
+        cfg_hash = hashing.hash_object(obj=[self._cfg, is_sig])[:8]
+        l_module = [SampleSplitter, SampleWeighter, efficiency_map, efficiency_kernel, map_repository]
+
+        # The uid of the input and the checksum of the maps are added in `get_misid`
+        # given that finding them is not needed when only parts of the sample are processed
+        super().__init__(
+                out_path = f'misid_calculator_{sample}_{q2bin}_{is_sig}_{cfg_hash}',
+                cfg      = self._cfg,
+                is_sig   = is_sig,
+                l_code   = [ hashing.hash_file(path=inspect.getfile(obj)) for obj in l_module ])
+    # -----------------------------
+    @staticmethod
+    def _add_q2_branches(cfg : dict) -> dict:
+        '''
+        Returns copy of config where the columns with the q2 bin labels are added to the
+        branches read by the splitter, if several q2 bins are processed at once.
+        Otherwise the config is returned unchanged
+        '''
+        l_q2bin = cfg['input']['q2bin']
+        if isinstance(l_q2bin, str):
+            return cfg
+
+        cfg      = copy.deepcopy(cfg)
+        l_branch = cfg['splitting'].get('branches', [])
+        l_branch+= [ f'q2bin_{q2bin}' for q2bin in l_q2bin if f'q2bin_{q2bin}' not in l_branch ]
+
+        cfg['splitting']['branches'] = l_branch
+
+        return cfg
     # -----------------------------
-    def _get_selection(self) -> dict[str,str]:
+    def _get_selection(self, q2bin : str) -> dict[str,str]:
         '''
+        Parameters
+        ----------------
+        q2bin: q2 bin, e.g. central
+
         Returns
         ----------------
         Dictionary with full selection, plus control region
         '''
         trigger = self._cfg['input']['trigger']
-        q2bin   = self._cfg['input']['q2bin'  ]
         sample  = self._cfg['input']['sample' ]
 
         d_sel          = sel.selection(trigger=trigger, q2bin=q2bin, process=sample)
@@ -65,7 +122,145 @@ class MisIDCalculator:
 
         return d_sel
     # -----------------------------
-    def _get_sample(self, arg : tuple[bool,str]) -> pnd.DataFrame:
+    def _get_q2_selection(self) -> tuple[dict[str,str],dict[str,str]]:
+        '''
+        Returns
+        ----------------
+        Tuple with:
+
+        - Dictionary with the cuts that are the same for all the q2 bins in the config
+        - Dictionary mapping each q2 bin to the expression of the cuts that depend on it
+        '''
+        l_q2bin = self._cfg['input']['q2bin']
+        d_d_sel = { q2bin : self._get_selection(q2bin=q2bin) for q2bin in l_q2bin }
+        l_d_sel = list(d_d_sel.values())
+
+        l_name  = [ name for d_sel in l_d_sel for name in d_sel ]
+        l_name  = list(dict.fromkeys(l_name))
+        l_q2cut = [ name for name in l_name if any(d_sel.get(name) != l_d_sel[0].get(name) for d_sel in l_d_sel) ]
+
+        d_sel   = { name : expr for name, expr in l_d_sel[0].items() if name not in l_q2cut }
+        d_q2    = {}
+        for q2bin, d_sel_q2 in d_d_sel.items():
+            l_expr      = [ f'({d_sel_q2[name]})' for name in l_q2cut if name in d_sel_q2 ]
+            d_q2[q2bin] = ' && '.join(l_expr) if len(l_expr) > 0 else '(1)'
+
+        log.debug(f'Cuts depending on q2 bin: {l_q2cut}')
+
+        return d_sel, d_q2
+    # -----------------------------
+    def _get_rdfs(self, entry_range : tuple[int,int]|None = None) -> dict[str,RDataFrame]:
+        '''
+        Parameters
+        ----------------
+        entry_range: Range of entries to process, by default the `range` in the `input` section of the config, if any
+
+        Returns
+        ----------------
+        Dictionary mapping name to ROOT dataframe after selection and with `uid` attribute attached.
+        If `per_file` is true in the `input` section of the config, there will be one dataframe per file,
+        with the name of the file as key, such that each file is split and cached on its own. Otherwise
+        the dictionary has a single dataframe with an empty string as key.
+
+        Finding the identifiers of the input needs opening all the files, it is done only the first time,
+        such that copies of this instance, e.g. sent to other processes, do not do it again
+        '''
+        sample  = self._cfg['input']['sample']
+        trigger = self._cfg['input']['trigger']
+        project = self._cfg['input']['project']
+
+        log.debug(f'Loading: {sample}/{trigger}/{project}')
+
+        obj     = RDFGetter(sample=sample, trigger=trigger, analysis=project)
+        entry_range = self._cfg['input'].get('range') if entry_range is None else list(entry_range)
+        if not self._cfg['input'].get('per_file', False):
+            rdf     = obj.get_rdf()
+            if '' not in self._d_uid:
+                self._d_uid[''] = hashing.hash_object(obj=[obj.get_uid(), self._get_getter_settings(obj=obj)])
+
+            rdf,uid = self._filter_rdf(rdf=rdf, uid=self._d_uid[''], entry_range=entry_range)
+            rdf.uid = uid
+            # Different ranges of the same sample can be processed at the same time, they need their own outputs
+            name    = '' if entry_range is None else f'range_{entry_range[0]}_{entry_range[1]}'
+
+            return {name : rdf}
+
+        if entry_range is not None:
+            raise ValueError(f'Range of entries {entry_range} cannot be used when processing per file')
+
+        d_rdf_file = obj.get_rdf(per_file=True)
+        if len(self._d_uid) == 0:
+            self._d_uid = self._get_file_uids(obj=obj, l_fpath=list(d_rdf_file))
+
+        d_uid      = self._d_uid
+
+        d_rdf = {}
+        for fpath, rdf in sorted(d_rdf_file.items()):
+            name    = os.path.splitext(os.path.basename(fpath))[0]
+            uid     = d_uid[fpath]
+            rdf,uid = self._filter_rdf(rdf=rdf, uid=uid, entry_range=None)
+            rdf.uid = uid
+
+            d_rdf[name] = rdf
+
+        log.info(f'Processing {len(d_rdf)} files')
+
+        return d_rdf
+    # -----------------------------
+    @staticmethod
+    def _get_getter_settings(obj : RDFGetter) -> dict:
+        '''
+        Returns dictionary with the settings of RDFGetter that change the dataframes it makes,
+        other than the input files, e.g. the range of entries or the custom columns
+        '''
+        # pylint: disable=protected-access
+        return {
+                'info'    : obj._d_info,
+                'columns' : RDFGetter._d_custom_columns,
+                'skip'    : RDFGetter._skip_adding_columns}
+    # -----------------------------
+    def _get_file_uids(self, obj : RDFGetter, l_fpath : list[str]) -> dict[str,str]:
+        '''
+        Parameters
+        ----------------
+        obj    : RDFGetter, after the dataframes of each file were made with `get_rdf(per_file=True)`
+        l_fpath: Paths to the files of the main tree, in the order returned by `get_rdf`
+
+        Returns
+        ----------------
+        Dictionary mapping each path to the unique identifier of its dataframe. As in `RDFGetter.get_uid`,
+        this is built from the paths and ROOT UUIDs of the files, the ones of the friend trees included, and
+        the settings of RDFGetter. The getter stores the paths of each tree in the same order, i.e.
+        the i-th file of each friend tree is the friend of the i-th file of the main tree
+        '''
+        l_path = obj._l_path # pylint: disable=protected-access
+        nfile  = len(l_fpath)
+        if len(l_path) % nfile != 0:
+            raise ValueError(f'Cannot match {len(l_path)} files to the {nfile} files of the main tree')
+
+        l_l_path = [ l_path[index:index + nfile] for index in range(0, len(l_path), nfile) ]
+        d_set    = self._get_getter_settings(obj=obj)
+        d_uid    = {}
+        for ifile, fpath in enumerate(l_fpath):
+            l_file = [ l_tree_path[ifile] for l_tree_path in l_l_path ]
+            if fpath not in l_file:
+                raise ValueError(f'Cannot find friend files of: {fpath}')
+
+            l_uuid = []
+            for path in l_file:
+                tfile = TFile(path)
+                l_uuid.append(tfile.GetUUID().AsString())
+                tfile.Close()
+
+            d_uid[fpath] = hashing.hash_object(obj=[l_file, l_uuid, d_set])
+
+        return d_uid
+    # -----------------------------
+    def _get_sample(
+            self,
+            arg         : tuple[bool,str],
+            dropna      : bool                = True,
+            entry_range : tuple[int,int]|None = None) -> pnd.DataFrame:
         '''
         Method in charge of steering:
 
@@ -73,30 +268,266 @@ class MisIDCalculator:
         - Splitting
         - Weighting
 
-        This method needs to take one argument to be used with multiprocessing
+        This method needs to take one argument to be used with multiprocessing.
+        For `dropna` see `_weight_sample` and for `entry_range` see `_get_rdfs`
         '''
         is_bplus, hadron_id = arg
 
+        sample   = self._cfg['input']['sample']
+        d_rdf    = self._get_rdfs(entry_range=entry_range)
+
+        log.info(f'Splitting samples: Bplus={is_bplus}, Hadron={hadron_id}')
+        l_df     = []
+        for name, rdf in d_rdf.items():
+            splitter = SampleSplitter(
+                    rdf      = rdf,
+                    sample   = sample,
+                    is_bplus = is_bplus,
+                    hadron_id= hadron_id,
+                    cfg      = self._cfg['splitting'],
+                    name     = name)
+            l_df.append(splitter.get_samples())
+
+        df       = pnd.concat(l_df, ignore_index=True) if len(l_df) > 1 else l_df[0]
+
+        return self._weight_sample(df=df, is_bplus=is_bplus, hadron_id=hadron_id, dropna=dropna)
+    # -----------------------------
+    def _get_samples_one_pass(self) -> list[pnd.DataFrame]:
+        '''
+        Reads and selects the input once and splits it for both charges and hadrons
+        in a single event loop, see `SampleSplitter.get_partitions`
+
+        Returns
+        ----------------
+        List of weighted dataframes, one per charge and hadron
+        '''
+        sample = self._cfg['input']['sample']
+        d_rdf  = self._get_rdfs()
+
+        log.info('Splitting samples for all charges and hadrons')
+        d_l_df : dict[tuple[bool,str],list[pnd.DataFrame]] = {}
+        for name, rdf in d_rdf.items():
+            d_df = SampleSplitter.get_partitions(rdf=rdf, sample=sample, cfg=self._cfg['splitting'], name=name)
+            for key, df in d_df.items():
+                d_l_df.setdefault(key, []).append(df)
+
+        d_df   = { key : pnd.concat(l_df, ignore_index=True) if len(l_df) > 1 else l_df[0] for key, l_df in d_l_df.items() }
+        l_df   = [ self._weight_sample(df=df, is_bplus=is_bplus, hadron_id=hadron_id) for (is_bplus, hadron_id), df in d_df.items() ]
+
+        return l_df
+    # -----------------------------
+    def _get_samples_multithreaded(self, nthreads : int) -> list[pnd.DataFrame]:
+        '''
+        Same as `_get_samples_one_pass`, but running the event loop with
+        ROOT's implicit multithreading
+
+        Parameters
+        ----------------
+        nthreads: Number of threads
+
+        Returns
+        ----------------
+        List of weighted dataframes, one per charge and hadron
+        '''
+        entry_range = self._cfg['input'].get('range')
+        if entry_range is not None:
+            raise ValueError(f'Range of entries {entry_range} cannot be used with multithreading')
+
+        log.warning(f'Using multithreading with {nthreads} threads')
+        with RDFGetter.multithreading(nthreads=nthreads):
+            l_df = self._get_samples_one_pass()
+
+        return l_df
+    # -----------------------------
+    def get_ranges(self, nshard : int) -> list[tuple[int,int]]:
+        '''
+        Parameters
+        ----------------
+        nshard: Number of shards
+
+        Returns
+        ----------------
+        List of ranges of entries, one per shard, covering the whole sample
+        '''
+        if self._cfg['input'].get('range') is not None:
+            raise ValueError('Range of entries cannot be used with sharding')
+
+        if self._cfg['input'].get('per_file', False):
+            raise ValueError('Sharding cannot be used when processing per file')
+
         sample  = self._cfg['input']['sample']
         trigger = self._cfg['input']['trigger']
         project = self._cfg['input']['project']
 
-        log.debug(f'Loading: {sample}/{trigger}/{project}')
+        obj      = RDFGetter(sample=sample, trigger=trigger, analysis=project)
+        nentries = self._get_entries(obj=obj)
+        arr_edge = numpy.linspace(0, nentries, nshard + 1).astype(int)
 
-        obj     = RDFGetter(sample=sample, trigger=trigger, analysis=project)
-        rdf     = obj.get_rdf()
-        uid     = obj.get_uid()
-        rdf,uid = self._filter_rdf(rdf=rdf, uid=uid)
-        rdf.uid = uid
+        l_range  = [ (int(low), int(high)) for low, high in zip(arr_edge[:-1], arr_edge[1:]) if high > low ]
 
-        log.info(f'Splitting samples: Bplus={is_bplus}, Hadron={hadron_id}')
-        splitter = SampleSplitter(
-                rdf      = rdf,
-                sample   = sample,
-                is_bplus = is_bplus,
-                hadron_id= hadron_id,
-                cfg      = self._cfg['splitting'])
-        df       = splitter.get_samples()
+        log.info(f'Split {nentries} entries into {len(l_range)} shards')
+
+        return l_range
+    # -----------------------------
+    @staticmethod
+    def _get_entries(obj : RDFGetter) -> int:
+        '''
+        Returns number of entries of the dataframe made by the getter, read from the headers of the
+        files of the main tree, i.e. without building the dataframe or running an event loop.
+        The friend trees have the same entries
+        '''
+        # pylint: disable=protected-access
+        d_data = obj._get_samples()
+        l_path = d_data['samples'][obj._main_tree]['files']
+
+        chain  = TChain(obj._tree_name)
+        for path in l_path:
+            chain.Add(path)
+
+        nentries    = chain.GetEntries()
+        max_entries = RDFGetter._max_entries
+        if max_entries >= 0:
+            nentries = min(nentries, max_entries)
+
+        return int(nentries)
+    # -----------------------------
+    def _get_shard(self, arg : tuple[bool,str,int,int]) -> pnd.DataFrame:
+        '''
+        Parameters
+        ----------------
+        arg: Tuple with is_bplus, hadron_id and lower and upper bounds of the range of entries
+
+        Returns
+        ----------------
+        Weighted dataframe for the range of entries, see `get_shard`.
+        This method needs to take one argument to be used with multiprocessing
+        '''
+        is_bplus, hadron_id, min_entry, max_entry = arg
+
+        return self.get_shard(is_bplus=is_bplus, hadron_id=hadron_id, entry_range=(min_entry, max_entry))
+    # -----------------------------
+    def get_shard(
+            self,
+            is_bplus    : bool,
+            hadron_id   : str,
+            entry_range : tuple[int,int]) -> pnd.DataFrame:
+        '''
+        Same as `get_sample` for a range of entries, e.g. one of the ranges returned by `get_ranges`.
+        The candidates with NaNs are kept, the shards are meant to be merged with `merge_shards`
+        '''
+        return self._get_sample(arg=(is_bplus, hadron_id), dropna=False, entry_range=entry_range)
+    # -----------------------------
+    def _run(
+            self,
+            executor : Executor,
+            func     : Callable,
+            l_arg    : list) -> list:
+        '''
+        Runs `func` on each argument with the executor, after sharing the maps with it
+        '''
+        l_path = MapRepository.get_paths(pkl_dir=self._cfg['weights']['path'])
+        executor.share_maps(l_path)
+
+        return executor.map(func, l_arg)
+    # -----------------------------
+    def _get_uid(self) -> str:
+        '''
+        Returns unique identifier of the selected input, built from the identifiers of its dataframes.
+        It is found only the first time
+        '''
+        if self._uid is not None:
+            return self._uid
+
+        d_rdf     = self._get_rdfs()
+        l_uid     = [ (name, rdf.uid) for name, rdf in d_rdf.items() ]
+        self._uid = hashing.hash_object(obj=l_uid)
+
+        return self._uid
+    # -----------------------------
+    def _get_samples_sharded(
+            self,
+            l_arg  : list[tuple[bool,str]],
+            nshard   : int,
+            executor : Executor|None) -> list[pnd.DataFrame]:
+        '''
+        Splits the sample in ranges of entries and processes all the shards of all the
+        charges and hadrons in parallel
+
+        Parameters
+        ----------------
+        l_arg   : List of tuples with is_bplus and hadron_id
+        nshard  : Number of shards per sample
+        executor: Executor running the shards, if not passed, ProcessExecutor will be used
+
+        Returns
+        ----------------
+        List of weighted dataframes, one per charge and hadron, with the shards merged
+        in the order in which the sample is processed without sharding
+        '''
+        l_range = self.get_ranges(nshard=nshard)
+        l_task  = [ (is_bplus, hadron_id, low, high) for is_bplus, hadron_id in l_arg for low, high in l_range ]
+        nproc   = min(len(l_task), os.cpu_count() or 1)
+        executor= ProcessExecutor(nproc=nproc) if executor is None else executor
+
+        log.warning(f'Processing {len(l_task)} shards with {executor.__class__.__name__}')
+        l_df_shard = self._run(executor=executor, func=self._get_shard, l_arg=l_task)
+
+        nrange = len(l_range)
+        l_df   = [ self.merge_shards(l_df=l_df_shard[iarg * nrange:(iarg + 1) * nrange]) for iarg in range(len(l_arg)) ]
+
+        return l_df
+    # -----------------------------
+    @staticmethod
+    def merge_shards(l_df : list[pnd.DataFrame]) -> pnd.DataFrame:
+        '''
+        Parameters
+        ----------------
+        l_df: List of dataframes returned by `get_shard`, for the same charge and hadron, in the order of the ranges
+
+        Returns
+        ----------------
+        Dataframe with the shards merged in the order in which the sample is processed without sharding,
+        after dropping the candidates with NaNs
+        '''
+        df = pnd.concat(l_df, ignore_index=True)
+        df = MisIDCalculator._dropna(df=df)
+
+        return MisIDCalculator._sort_kinds(df=df)
+    # -----------------------------
+    @staticmethod
+    def _sort_kinds(df : pnd.DataFrame) -> pnd.DataFrame:
+        '''
+        Sorts candidates by kind, in the order used by SampleSplitter, keeping the order
+        of the candidates within each kind
+        '''
+        if 'kind' not in df.columns:
+            return df
+
+        arr_kind = pnd.Categorical(df['kind'], categories=['PassFail', 'FailPass', 'FailFail'], ordered=True)
+        arr_ind  = numpy.argsort(arr_kind.codes, kind='stable')
+
+        return df.iloc[arr_ind].reset_index(drop=True)
+    # -----------------------------
+    def _weight_sample(
+            self,
+            df        : pnd.DataFrame,
+            is_bplus  : bool,
+            hadron_id : str,
+            dropna    : bool = True) -> pnd.DataFrame:
+        '''
+        Parameters
+        ----------------
+        df       : Dataframe with split sample
+        is_bplus : True if the sample contains B+ mesons
+        hadron_id: kaon or pion
+        dropna   : If True (default) candidates with NaNs are dropped, see `_dropna`.
+                   Parts of a sample are kept with them, such that they are dropped once the parts are merged
+
+        Returns
+        ----------------
+        Weighted dataframe, with `hadron` and `bmeson` columns
+        '''
+        sample = self._cfg['input']['sample']
 
         log.info('Applying weights')
         weighter = SampleWeighter(
@@ -110,72 +541,241 @@ class MisIDCalculator:
         df['hadron'] = hadron_id
         df['bmeson'] = 'bplus' if is_bplus else 'bminus'
 
+        if dropna:
+            df = self._dropna(df=df)
+
+        return df
+    # -----------------------------
+    @staticmethod
+    def _dropna(df : pnd.DataFrame) -> pnd.DataFrame:
+        '''
+        Returns dataframe without candidates with NaNs, raises if too many of them are dropped
+        '''
         # TODO: Use replace_nan to replace nans with 1s
         # This should drop up to 6% of the dataset
         # Due to NaNs in the PID maps.
-        df = put.dropna(df, max_frac=0.06)
-
-        return df
+        return put.dropna(df, max_frac=0.06)
     # -----------------------------
     def _filter_rdf(
             self,
-            rdf : RDataFrame,
-            uid : str) -> tuple[RDataFrame,str]:
+            rdf         : RDataFrame,
+            uid         : str,
+            entry_range : list[int]|None) -> tuple[RDataFrame,str]:
         '''
-        Take ROOT dataframe and its UniqueIDentifier
+        Take ROOT dataframe, its UniqueIDentifier and the range of entries to process, if any
 
         Filter by:
 
         - Select range of entries (optional)
         - Apply analysis selection
 
+        If several q2 bins are processed, the selection common to all of them is applied
+        and, for each bin, a boolean column `q2bin_{name}` is defined with the cuts that depend on the bin
+
         Returns
         -----------------
         Filtered dataframe and updated UniqueIDentifier
         '''
-        entry_range = self._cfg['input'].get('range')
         if entry_range is not None:
             log.warning(f'Limiting dataframe to {entry_range}')
             min_entry, max_entry = entry_range
             rdf = rdf.Range(min_entry, max_entry)
 
-        d_sel   = self._get_selection()
+        q2bin   = self._cfg['input']['q2bin']
+        if isinstance(q2bin, str):
+            d_sel = self._get_selection(q2bin=q2bin)
+            d_q2  = {}
+        else:
+            d_sel, d_q2 = self._get_q2_selection()
+
         log.info('Applying selection')
         for cut_name, cut_expr in d_sel.items():
             log.debug(f'{cut_name:<30}{cut_expr}')
             rdf = rdf.Filter(cut_expr, cut_name)
 
-        uid = hashing.hash_object(obj=[d_sel, uid, entry_range])
+        for q2bin, q2_expr in d_q2.items():
+            log.debug(f'{q2bin:<30}{q2_expr}')
+            rdf = rdf.Define(f'q2bin_{q2bin}', q2_expr)
+
+        if len(d_q2) == 0:
+            uid = hashing.hash_object(obj=[d_sel, uid, entry_range])
+        else:
+            uid = hashing.hash_object(obj=[d_sel, d_q2, uid, entry_range])
 
         return rdf, uid
     # -----------------------------
+    def get_sample(self, is_bplus : bool, hadron_id : str) -> pnd.DataFrame:
+        '''
+        Parameters
+        -------------------
+        is_bplus : True if the sample should contain B+ mesons
+        hadron_id: kaon or pion
+
+        Returns
+        -------------------
+        Weighted dataframe for a single charge and hadron, i.e. one of the
+        dataframes merged by `get_misid`. Meant to schedule the pieces of several samples
+        in a single pool of workers
+        '''
+        return self._get_sample(arg=(is_bplus, hadron_id))
+    # -----------------------------
+    def _get_misid(
+            self,
+            multi_proc : bool,
+            one_pass   : bool,
+            nthreads   : int,
+            executor   : Executor|None) -> pnd.DataFrame:
+        '''
+        Returns weighted dataframe, see `get_misid`
+        '''
+        l_arg = [ (x, y) for x in [True,False] for y in ['kaon', 'pion'] ]
+
+        nshard = self._cfg['input'].get('shards', 1)
+        if nshard > 1:
+            l_df = self._get_samples_sharded(l_arg=l_arg, nshard=nshard, executor=executor)
+        elif nthreads > 1:
+            l_df = self._get_samples_multithreaded(nthreads=nthreads)
+        elif one_pass:
+            log.info('Processing all samples in one pass')
+            l_df = self._get_samples_one_pass()
+        else:
+            if executor is None:
+                executor = ProcessExecutor(nproc=len(l_arg)) if multi_proc else SerialExecutor()
+
+            log.info(f'Processing samples with {executor.__class__.__name__}')
+            l_df = self._run(executor=executor, func=self._get_sample, l_arg=l_arg)
+
+        log.debug('Merging dataframes')
+        df = pnd.concat(l_df)
+
+        return df
+    # -----------------------------
     @gut.timeit
-    def get_misid(self, multi_proc : bool = True) -> pnd.DataFrame:
+    def get_misid(
+            self,
+            multi_proc : bool          = True,
+            one_pass   : bool          = False,
+            nthreads   : int           = 1,
+            executor   : Executor|None = None) -> pnd.DataFrame:
         '''
         Parameters
         -------------------
-        multi_proc: If true will process four (2 charges x 2 hadron IDs) in parallel, default False
+        multi_proc: If true will process four (2 charges x 2 hadron IDs) in parallel with ProcessExecutor,
+                    otherwise, with SerialExecutor. Default True
+        one_pass  : If true, the input is read and selected once and split into the four
+                    samples in a single event loop. `multi_proc` is ignored. Default False
+        nthreads  : If larger than 1, will run in one pass, in a single process, with ROOT's
+                    implicit multithreading and this number of threads. `multi_proc` is ignored.
+                    The order of the candidates is not reproducible in this mode. Default 1
+        executor  : Executor used to process the four samples or the shards, see the executor module.
+                    If passed, `multi_proc` is ignored. Not used with `one_pass` or `nthreads`
+
+        If `shards` in the `input` section of the config is larger than one, the sample will be split
+        in that number of ranges of entries. All the shards, for all charges and hadrons, are processed
+        in parallel and merged in the order in which they would be processed without sharding. In this case
+        the arguments above are ignored.
+
+        The dataframe is cached with a key made from the config, `is_sig`, the unique identifier of the input
+        and the checksum of the maps, such that later calls with the same inputs read it from the cache,
+        regardless of the arguments above, see `get_cached`.
 
         Returns
         -------------------
         pandas dataframe with weighted entries with, extra columns
         hadron : kaon or pion
         bmeson : bplus or bminus
+        q2bin_x: True if the candidate is in q2 bin x, only when several q2 bins are in the config
 
         For a given kind of inputs, e.g (Data, signal, leakage)
         '''
-        l_arg = [ (x, y) for x in [True,False] for y in ['kaon', 'pion'] ]
+        df = self.get_cached()
+        if df is not None:
+            return df
 
-        if multi_proc:
-            nproc = len(l_arg)
-            log.warning(f'Using multiprocessing with {nproc} processes')
-            with Pool(processes=nproc) as pool:
-                l_df = pool.map(self._get_sample, l_arg)
-        else:
-            l_df = [ self._get_sample(arg) for arg in l_arg ]
+        df = self._get_misid(
+                multi_proc = multi_proc,
+                one_pass   = one_pass,
+                nthreads   = nthreads,
+                executor   = executor)
 
-        log.debug('Merging dataframes')
-        df = pnd.concat(l_df)
+        self.set_cached(df=df)
 
         return df
+    # -----------------------------
+    def get_cached(self) -> pnd.DataFrame|None:
+        '''
+        Returns
+        -------------------
+        Weighted dataframe returned by `get_misid`, if it is in the cache, otherwise None.
+        Meant to be used, with `set_cached`, by code that makes the dataframe out of the ones returned
+        by `get_sample` or `get_shard`, e.g. MisIDDataset
+        '''
+        if 'uid' not in self._dat_hash:
+            l_path = MapRepository.get_paths(pkl_dir=self._cfg['weights']['path'])
+
+            self._dat_hash['uid' ] = self._get_uid()
+            self._dat_hash['maps'] = MapRepository.get_checksum(l_path)
+
+        out_path = f'{self._out_path}/misid.parquet'
+        if not self._copy_from_cache():
+            return None
+
+        log.warning(f'Reading weighted dataframe from cache: {out_path}')
+
+        return pnd.read_parquet(out_path)
+    # -----------------------------
+    def set_cached(self, df : pnd.DataFrame) -> None:
+        '''
+        Parameters
+        -------------------
+        df: Weighted dataframe, as returned by `get_misid`, for the inputs of this calculator.
+            It is saved and cached, such that `get_misid` and `get_cached` read it later.
+            `get_cached` has to be called first, to find the key of the cache
+        '''
+        if 'uid' not in self._dat_hash:
+            raise ValueError('Key of cache not found, call get_cached first')
+
+        df.to_parquet(f'{self._out_path}/misid.parquet')
+        self._cache()
+    # -----------------------------
+    def get_misid_q2bins(self, **kwargs) -> dict[str,pnd.DataFrame]:
+        '''
+        Parameters
+        -------------------
+        kwargs: Arguments passed to `get_misid`
+
+        Returns
+        -------------------
+        Dictionary mapping q2 bin to dataframe, as returned by `get_misid`. If several q2 bins are
+        in the config, the samples are selected, split and weighted once for all of them.
+        A candidate is in the dataframe of every bin it belongs to, i.e. bins can overlap
+        '''
+        q2bin = self._cfg['input']['q2bin']
+        df    = self.get_misid(**kwargs)
+        if isinstance(q2bin, str):
+            return {q2bin : df}
+
+        return self.split_q2bins(df=df, l_q2bin=q2bin)
+    # -----------------------------
+    @staticmethod
+    def split_q2bins(df : pnd.DataFrame, l_q2bin : list[str]) -> dict[str,pnd.DataFrame]:
+        '''
+        Parameters
+        -------------------
+        df     : Dataframe with columns `q2bin_{name}` labelling the candidates in each bin
+        l_q2bin: List of q2 bins
+
+        Returns
+        -------------------
+        Dictionary mapping q2 bin to dataframe with its candidates, without the label columns
+        '''
+        l_col = [ f'q2bin_{q2bin}' for q2bin in l_q2bin ]
+        d_df  = {}
+        for q2bin, column in zip(l_q2bin, l_col):
+            df_bin      = df[df[column].astype(bool)]
+            d_df[q2bin] = df_bin.drop(columns=l_col)
+
+            log.debug(f'Found {len(df_bin)}/{len(df)} candidates in q2 bin {q2bin}')
+
+        return d_df
 # -----------------------------
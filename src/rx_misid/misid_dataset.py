@@ -1,12 +1,17 @@
 '''
 Module holding MisIDDataset class
 '''
+import os
 import copy
+from collections     import Counter
 
 import pandas                as pnd
 import dmu.generic.utilities as gut
 from dmu.logging.log_store     import LogStore
+from rx_data.rdf_getter        import RDFGetter
 from rx_misid.misid_calculator import MisIDCalculator
+from rx_misid.map_repository   import MapRepository
+from rx_misid.executor         import Executor, SerialExecutor, ProcessExecutor
 
 log=LogStore.add_logger('rx_misid:misid_dataset')
 # -------------------------------------------------------
@@ -20,14 +25,16 @@ class MisIDDataset:
     - In a dictionary of dataframes, one per sample, data, MC signal, etc
     '''
     # ---------------------------------
-    def __init__(self, q2bin : str):
+    def __init__(self, q2bin : str|list[str], is_sig : bool = True):
         '''
         Parameters:
         -----------------
-        q2bin  : All the datasets will be in this q2 bin
-        version: Needed to pick configuration
+        q2bin  : All the datasets will be in this q2 bin. If a list of bins is passed, the samples
+                 are processed once for all of them, see `get_data_q2bins`
+        is_sig : If true (default), weights transfer the samples to the signal region, otherwise to the control region
         '''
         self._q2bin     = q2bin
+        self._is_sig    = is_sig
 
         self._sample    : str
         self._out_dir   : str
@@ -40,26 +47,152 @@ class MisIDDataset:
 
         return cfg
     # ---------------------------------
-    def _make_dataframe(self, sample : str) -> pnd.DataFrame:
+    def _get_sample_config(self, sample : str) -> dict:
         '''
-        For a given sample (e.g. Bu_Kee_eq_btosllball05_DPC), through MisIDCalculator,
-        get a pandas dataframe with correct weights and return it
+        Returns copy of configuration, meant to be passed to MisIDCalculator, for a given sample
         '''
         cfg = copy.deepcopy(self._cfg)
         cfg['input']['sample'] = sample
 
-        obj = MisIDCalculator(cfg=cfg)
-        df  = obj.get_misid()
+        return cfg
+    # ---------------------------------
+    def _get_cost(self, sample : str) -> int:
+        '''
+        Returns
+        ----------------
+        Size in bytes of the input files of the sample, friend trees included, used to estimate
+        how long it takes to process it. Only the paths are found, i.e. no dataframe is built
+        '''
+        trigger = self._cfg['input']['trigger']
+        project = self._cfg['input']['project']
+
+        obj     = RDFGetter(sample=sample, trigger=trigger, analysis=project)
+        obj._get_samples()  # pylint: disable=protected-access
+        size    = sum(os.path.getsize(fpath) for fpath in obj._l_path) # pylint: disable=protected-access
+
+        log.debug(f'{sample:<40}{size / 1e9:.2f} GB')
+
+        return size
+    # ---------------------------------
+    def _get_tasks(self, only_data : bool) -> list[tuple[str,str,bool,str]]:
+        '''
+        Parameters
+        ----------------
+        only_data: If True, only the tasks for the data component are returned
+
+        Returns
+        ----------------
+        List of tuples (component, sample, is_bplus, hadron_id), one per task, in the order
+        in which the dataframes are merged, i.e. the same order used by MisIDCalculator.get_misid
+        '''
+        d_component = self._cfg['splitting']['samples']
+        l_task      = []
+        for component, l_sample in d_component.items():
+            if only_data and component != 'data':
+                log.debug(f'Skipping non-data {component}')
+                continue
+
+            for sample in l_sample:
+                l_task += [ (component, sample, is_bplus, hadron_id) for is_bplus in [True, False] for hadron_id in ['kaon', 'pion'] ]
+
+        return l_task
+    # ---------------------------------
+    def _get_shards(
+            self,
+            l_task  : list[tuple[str,str,bool,str]],
+            l_itask : list[int],
+            d_calc  : dict[str,MisIDCalculator],
+            nshard  : int) -> list[tuple[int,tuple[int,int]|None]]:
+        '''
+        Parameters
+        ----------------
+        l_task : List of tasks, see `_get_tasks`
+        l_itask: Indices of the tasks that need to run
+        d_calc : Dictionary mapping sample to its calculator
+        nshard : Number of shards per sample
+
+        Returns
+        ----------------
+        List of tuples with the index of the task and the range of entries of the shard, one per shard.
+        The shards of a task are in the order of the ranges. If `nshard` is 1, there is one shard
+        per task, without range
+        '''
+        if nshard == 1:
+            return [ (itask, None) for itask in l_itask ]
+
+        d_range = {}
+        l_shard = []
+        for itask in l_itask:
+            sample = l_task[itask][1]
+            if sample not in d_range:
+                # Samples without entries are processed in a single task
+                d_range[sample] = d_calc[sample].get_ranges(nshard=nshard) or [None]
+
+            l_shard += [ (itask, entry_range) for entry_range in d_range[sample] ]
+
+        return l_shard
+    # ---------------------------------
+    @staticmethod
+    def _run_task(arg : tuple[int,MisIDCalculator,bool,str,tuple[int,int]|None]) -> tuple[int,pnd.DataFrame]:
+        '''
+        Parameters
+        ----------------
+        arg: Tuple with index of shard, calculator of the sample, is_bplus, hadron_id and range of entries,
+             None for the whole sample. The calculator is the one used to look up the cache, such that
+             the identifiers of the input it found are not found again
 
-        return df
+        Returns
+        ----------------
+        Tuple with index of shard and weighted dataframe.
+        This method needs to take one argument to be used with multiprocessing
+        '''
+        index, obj, is_bplus, hadron_id, entry_range = arg
+
+        if entry_range is None:
+            df = obj.get_sample(is_bplus=is_bplus, hadron_id=hadron_id)
+        else:
+            df = obj.get_shard(is_bplus=is_bplus, hadron_id=hadron_id, entry_range=entry_range)
+
+        return index, df
+    # ---------------------------------
+    def _get_results(self, l_arg : list[tuple[int,MisIDCalculator,bool,str,tuple[int,int]|None]], executor : Executor):
+        '''
+        Parameters
+        ----------------
+        l_arg   : List of arguments for `_run_task`
+        executor: Executor running the tasks
+
+        Returns
+        ----------------
+        Generator of tuples with index of task and dataframe, in the order in which tasks finish
+        '''
+        l_path = MapRepository.get_paths(pkl_dir=self._cfg['weights']['path'])
+        executor.share_maps(l_path)
+
+        log.warning(f'Processing {len(l_arg)} tasks with {executor.__class__.__name__}')
+        yield from executor.imap_unordered(self._run_task, l_arg)
     # ---------------------------------
     def get_data(
             self,
-            only_data : bool = False) -> dict[str,pnd.DataFrame]:
+            only_data : bool          = False,
+            nproc     : int|None      = None,
+            executor  : Executor|None = None,
+            nshard    : int|None      = None) -> dict[str,pnd.DataFrame]:
         '''
         Parameters
         ----------------
         only_data: If False (default) will provide data and leakage components
+        nproc    : Number of processes used to process the samples with ProcessExecutor, by default,
+                   the number of CPUs. If 1, everything runs in this process, with SerialExecutor
+        executor : Executor running the tasks, see executor module. If passed, `nproc` is ignored
+        nshard   : Number of ranges of entries each task is split into, by default the value of `shards`
+                   in the `input` section of the config, or 1, i.e. no splitting
+
+        Every sample is processed in four tasks, one per charge and hadron, each of them split in `nshard` shards.
+        The shards of all the samples are given to a single executor, the ones of the largest inputs first.
+        The shards and tasks of a sample are merged as in `MisIDCalculator.get_misid` and the dataframe of the sample
+        is cached as that method does. Samples found in that cache are not processed. The dataframes of a component
+        are merged in the same order used when processing the samples one by one.
 
         Returns
         ----------------
@@ -71,16 +204,93 @@ class MisIDDataset:
         - Be used to _transfer_ the control region to the signal region
         - Scale the leakage from signal etc to the control region
         '''
+        nshard  = nshard or self._cfg['input'].get('shards', 1)
+        l_task  = self._get_tasks(only_data=only_data)
+        l_sample= list(dict.fromkeys(sample for _, sample, _, _ in l_task))
+        d_calc  = { sample : MisIDCalculator(cfg=self._get_sample_config(sample=sample), is_sig=self._is_sig) for sample in l_sample }
 
-        d_component = self._cfg['splitting']['samples']
-        d_df        = {}
-        for component, l_sample in d_component.items():
+        d_sample_df : dict[str,pnd.DataFrame] = {}
+        for sample, obj in d_calc.items():
+            df = obj.get_cached()
+            if df is not None:
+                d_sample_df[sample] = df
+
+        l_itask = [ itask for itask, (_, sample, _, _) in enumerate(l_task) if sample not in d_sample_df ]
+        l_shard = self._get_shards(l_task=l_task, l_itask=l_itask, d_calc=d_calc, nshard=nshard)
+        d_cost  = { sample : self._get_cost(sample=sample) for sample in l_sample if sample not in d_sample_df }
+        l_index = sorted(range(len(l_shard)), key=lambda index : -d_cost[l_task[l_shard[index][0]][1]])
+        nproc   = min(len(l_shard), nproc or os.cpu_count() or 1)
+
+        l_arg   = []
+        for index in l_index:
+            itask, entry_range             = l_shard[index]
+            _, sample, is_bplus, hadron_id = l_task[itask]
+            l_arg.append((index, d_calc[sample], is_bplus, hadron_id, entry_range))
+
+        if executor is None:
+            executor = SerialExecutor() if nproc <= 1 else ProcessExecutor(nproc=nproc)
+
+        d_nshard= Counter(itask for itask, _ in l_shard)
+        d_shard : dict[int,dict[int,pnd.DataFrame]] = { itask : {} for itask in d_nshard }
+        d_ntask = Counter(l_task[itask][1] for itask in l_itask)
+        d_l_df  : dict[str,dict[int,pnd.DataFrame]] = { sample : {} for sample in d_ntask }
+
+        results = self._get_results(l_arg=l_arg, executor=executor) if len(l_arg) > 0 else []
+        for ishard, df_shard in results:
+            itask = l_shard[ishard][0]
+            d_shard[itask][ishard] = df_shard
+            if len(d_shard[itask]) < d_nshard[itask]:
+                continue
+
+            d_ishard_df = d_shard.pop(itask)
+            l_df_shard  = [ d_ishard_df[key] for key in sorted(d_ishard_df) ]
+            df          = l_df_shard[0] if nshard == 1 else MisIDCalculator.merge_shards(l_df=l_df_shard)
+
+            sample = l_task[itask][1]
+            d_l_df[sample][itask] = df
+            if len(d_l_df[sample]) < d_ntask[sample]:
+                continue
+
+            log.info(f'Caching sample: {sample}')
+            d_itask_df          = d_l_df.pop(sample)
+            d_sample_df[sample] = pnd.concat([ d_itask_df[key] for key in sorted(d_itask_df) ])
+            d_calc[sample].set_cached(df=d_sample_df[sample])
+
+        d_df = {}
+        for component, l_sample_comp in self._cfg['splitting']['samples'].items():
             if only_data and component != 'data':
-                log.debug(f'Skipping non-data {component}')
                 continue
 
-            l_df            = [ self._make_dataframe(sample=sample) for sample in l_sample ]
-            d_df[component] = pnd.concat(l_df)
+            log.info(f'Merging component: {component}')
+            d_df[component] = pnd.concat([ d_sample_df[sample] for sample in l_sample_comp ])
 
         return d_df
+    # ---------------------------------
+    def get_data_q2bins(
+            self,
+            only_data : bool          = False,
+            nproc     : int|None      = None,
+            executor  : Executor|None = None,
+            nshard    : int|None      = None) -> dict[str,dict[str,pnd.DataFrame]]:
+        '''
+        Parameters
+        ----------------
+        See `get_data`
+
+        Returns
+        ----------------
+        Dictionary mapping q2 bin to the dictionary returned by `get_data` for that bin.
+        The samples are read, split and weighted once for all the bins passed in the initializer
+        '''
+        d_df = self.get_data(only_data=only_data, nproc=nproc, executor=executor, nshard=nshard)
+        if isinstance(self._q2bin, str):
+            return {self._q2bin : d_df}
+
+        d_d_df = { q2bin : {} for q2bin in self._q2bin }
+        for component, df in d_df.items():
+            d_df_q2 = MisIDCalculator.split_q2bins(df=df, l_q2bin=self._q2bin)
+            for q2bin, df_q2 in d_df_q2.items():
+                d_d_df[q2bin][component] = df_q2
+
+        return d_d_df
 # ---------------------------------
@@ -1,13 +1,24 @@
 '''
 Module holding SampleSplitter class
 '''
+import os
+import time
+import shutil
+import tempfile
 
-import pandas as pnd
-from ROOT                   import RDataFrame
+import numpy
+import pandas          as pnd
+import pyarrow         as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import uproot
+from ROOT                   import RDataFrame, RDF
 
 from dmu.rdataframe         import utilities as ut
+from dmu.generic            import utilities as gut
 from dmu.logging.log_store  import LogStore
 from dmu.workflow.cache     import Cache     as Wcache
+from rx_misid.sample_weighter import SampleWeighter
 
 log=LogStore.add_logger('rx_misid:sample_splitter')
 # --------------------------------
@@ -16,6 +27,24 @@ class SampleSplitter(Wcache):
     Class meant to split a dataframe into PassFail, FailPass and FailFail samples
     based on a configuration
     '''
+    # Sizes in bytes of scalar column types, used to estimate size of branches not read
+    _d_size = {
+            'double' : 8, 'Double_t' : 8, 'float'  : 4, 'Float_t'  : 4,
+            'long'   : 8, 'Long64_t' : 8, 'Long_t' : 8, 'ULong64_t': 8, 'ULong_t': 8, 'unsigned long' : 8,
+            'int'    : 4, 'Int_t'    : 4, 'UInt_t' : 4, 'unsigned int'  : 4,
+            'short'  : 2, 'Short_t'  : 2, 'UShort_t' : 2, 'unsigned short': 2,
+            'bool'   : 1, 'Bool_t'   : 1, 'char'   : 1, 'Char_t'   : 1, 'UChar_t': 1, 'unsigned char' : 1}
+
+    # Types of arrays read from scalar branches, used to make empty samples with all the branches
+    _d_dtype = {
+            'double' : 'float64', 'Double_t' : 'float64', 'float'  : 'float32', 'Float_t'  : 'float32',
+            'long'   : 'int64'  , 'Long64_t' : 'int64'  , 'Long_t' : 'int64'  , 'ULong64_t': 'uint64', 'ULong_t': 'uint64', 'unsigned long' : 'uint64',
+            'int'    : 'int32'  , 'Int_t'    : 'int32'  , 'UInt_t' : 'uint32' , 'unsigned int'  : 'uint32',
+            'short'  : 'int16'  , 'Short_t'  : 'int16'  , 'UShort_t' : 'uint16', 'unsigned short': 'uint16',
+            'bool'   : 'bool'   , 'Bool_t'   : 'bool'   , 'char'   : 'int8'   , 'Char_t'   : 'int8'  , 'UChar_t': 'uint8' , 'unsigned char' : 'uint8'}
+
+    _l_part = ['kind', 'block'] # Columns used to partition cached dataset
+    _index  = '_index'          # Column with position of each row in the table, used to restore the order when reading the dataset
     # --------------------------------
     def __init__(
             self,
@@ -23,15 +52,22 @@ class SampleSplitter(Wcache):
             sample   : str,
             hadron_id: str,
             is_bplus : bool,
-            cfg      : dict):
+            cfg      : dict,
+            name     : str = ''):
         '''
         rdf     : Input dataframe with data to split, It should have attached a `uid` attribute, the unique identifier
         sample  : Sample name, e.g. DATA_24_..., needed for output naming
         is_bplus: True if the sam ple that will be returned will contain B+ mesons, false for B-
         cfg     : Dictionary with configuration specifying how to split the samples
+        name    : Identifier of the part of the sample in `rdf`, e.g. the input file, when the sample
+                  is split per file. Used for output naming, by default empty, i.e. the whole sample
         '''
+        out_path = f'sample_splitter_{sample}_{hadron_id}_{is_bplus}'
+        if name != '':
+            out_path = f'{out_path}_{name}'
+
         super().__init__(
-                out_path = f'sample_splitter_{sample}_{hadron_id}_{is_bplus}',
+                out_path = out_path,
                 args     = [rdf.uid, hadron_id, is_bplus, cfg])
 
         self._b_id     = 521
@@ -41,6 +77,61 @@ class SampleSplitter(Wcache):
         self._cfg      = cfg
         self._l_kind   = ['PassFail', 'FailPass', 'FailFail']
         self._rdf      = rdf
+        self._l_branch = self._get_branches()
+        self._max_mem  = cfg.get('max_memory') # In MB, if set, samples are streamed to disk, see `_stream_samples`
+        self._tmp_dir  = None
+    # --------------------------------
+    def _get_branches(self) -> list[str]:
+        '''
+        Returns
+        -----------------
+        Sorted list of branches to be read, i.e. the ones needed for weighting with the maps,
+        the observables and any extra branch in `branches`. Raises if any of them is missing
+        '''
+        s_branch = SampleWeighter.get_columns(cfg=self._cfg['maps'])
+        s_branch|= set(self._cfg['observables'])
+        s_branch|= set(self._cfg.get('branches', []))
+        s_branch-= {'kind', 'hadron'} # These are added by the splitter
+
+        s_column = { str(name) for name in self._rdf.GetColumnNames() }
+        l_missing= sorted(s_branch - s_column)
+        if len(l_missing) > 0:
+            raise ValueError(f'Missing branches in {self._sample}: {l_missing}')
+
+        l_branch = sorted(s_branch)
+        log.debug(f'Reading branches: {l_branch}')
+
+        return l_branch
+    # --------------------------------
+    def _save_branch_report(self, nentries : int, nbytes : int) -> None:
+        '''
+        Saves JSON file with the branches read and an estimate of the bytes saved by not
+        reading the remaining scalar branches of the dataframe, for the same entries
+
+        Parameters
+        -----------------
+        nentries: Number of entries in split samples
+        nbytes  : Number of bytes in branches read, for split samples
+        '''
+        nsaved   = 0
+        for name in self._rdf.GetColumnNames():
+            name = str(name)
+            if name in self._l_branch:
+                continue
+
+            size    = self._d_size.get(str(self._rdf.GetColumnType(name)), 0)
+            nsaved += size * nentries
+
+        log.info(f'Read {nbytes / 1e6:.1f} MB, saved {nsaved / 1e6:.1f} MB for {self._sample}')
+
+        data = {
+                'sample'   : self._sample,
+                'entries'  : nentries,
+                'branches' : self._l_branch,
+                'bytes'    : nbytes,
+                'saved'    : nsaved}
+
+        gut.dump_json(data, f'{self._out_path}/branches.json', exists_ok=True)
     # --------------------------------
     def _filter_rdf(self, rdf : RDataFrame) -> RDataFrame:
         bid = self._b_id if self._is_bplus else - self._b_id
@@ -86,28 +177,80 @@ class SampleSplitter(Wcache):
 
         return cut_ss, cut_os
     # --------------------------------
-    def _rdf_to_df(self, rdf : RDataFrame) -> pnd.DataFrame:
+    def _book(self, rdf : RDataFrame, kind : str|None) -> tuple:
+        '''
+        Parameters
+        ---------------
+        rdf : ROOT dataframe
+        kind: Kind of sample, e.g. PassFail, None for MC
+
+        Returns
+        ---------------
+        Tuple with lazy results for the branches and the cutflow report of the dataframe.
+        Nothing is read until the values are requested, such that all the results booked
+        on the same dataframe are filled in a single event loop.
+
+        If `max_memory` was specified, the branches are booked as a snapshot in a temporary
+        ROOT file, instead of being kept in memory
+        '''
+        rep = rdf.Report()
+        if self._max_mem is None:
+            log.debug('Booking branches')
+            data = rdf.AsNumpy(self._l_branch, lazy=True)
+
+            return data, rep
+
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='sample_splitter_')
+
+        opts       = RDF.RSnapshotOptions()
+        opts.fLazy = True
+        file_path  = f'{self._tmp_dir}/{kind or "all"}.root'
+
+        log.debug(f'Booking snapshot: {file_path}')
+        data = rdf.Snapshot('tree', file_path, self._l_branch, opts)
+
+        return data, rep
+    # --------------------------------
+    def _results_to_table(self, data, rep) -> pa.Table:
         '''
         Parameters
         ---------------
-        rdf: ROOT dataframe
+        data: Lazy result of AsNumpy, see `_book`
+        rep : Lazy cutflow report, see `_book`
 
         Returns
         ---------------
-        Pandas dataframe with subset of columns
+        Arrow table with subset of columns. The table wraps the arrays
+        filled by the event loop, i.e. the branches are not copied
         '''
-        l_branch = self._cfg['branches']
         log.debug('Storing branches')
-        data     = rdf.AsNumpy(l_branch)
-        df       = pnd.DataFrame(data)
+        d_data   = data.GetValue()
+        table    = pa.table({ name : pa.array(numpy.asarray(arr)) for name, arr in d_data.items() })
 
-        if len(df) == 0:
-            rep      = rdf.Report()
+        if table.num_rows == 0:
             cutflow  = ut.rdf_report_to_df(rep)
             log.warning('Empty dataset:\n')
             log.info(cutflow)
 
-        return df
+        return table
+    # --------------------------------
+    @staticmethod
+    def _add_constant(table : pa.Table, name : str, value : str) -> pa.Table:
+        '''
+        Returns table with extra column `name`, filled with `value`
+        '''
+        arr_val = pa.array([value] * table.num_rows, type=pa.string())
+
+        return table.append_column(name, arr_val)
+    # --------------------------------
+    @staticmethod
+    def _to_pandas(table : pa.Table) -> pnd.DataFrame:
+        '''
+        Returns pandas dataframe made from table, without consolidating columns,
+        i.e. avoiding copies, the table is not usable afterwards
+        '''
+        return table.to_pandas(split_blocks=True, self_destruct=True)
     # --------------------------------
     def _hadron_from_sample(self) -> str:
         '''
@@ -127,6 +270,317 @@ class SampleSplitter(Wcache):
 
         raise ValueError(f'Unrecognized sample: {self._sample}')
     # --------------------------------
+    def _book_samples(self) -> dict[str|None,tuple]:
+        '''
+        Returns
+        ---------------
+        Dictionary mapping kind, e.g. PassFail, to lazy results, see `_book`.
+        For MC there is a single entry with `None` as key, given that no splitting is done.
+        '''
+        self._rdf = self._filter_rdf(rdf=self._rdf)
+
+        if not self._sample.startswith('DATA_'):
+            return {None : self._book(rdf=self._rdf, kind=None)}
+
+        # All kinds are booked before any of them is requested
+        # such that the data is read only once
+        d_res = {}
+        for kind in self._l_kind:
+            log.info(f'Booking sample: {kind}')
+            rdf            = self._rdf
+            cut_ss, cut_os = self._get_cuts(kind=kind)
+
+            rdf = rdf.Filter(cut_os, f'OS {kind}')
+            rdf = rdf.Filter(cut_ss, f'SS {kind}')
+
+            d_res[kind] = self._book(rdf=rdf, kind=kind)
+
+        return d_res
+    # --------------------------------
+    def _write_table(
+            self,
+            table        : pa.Table,
+            dataset_path : str,
+            basename     : str|None = None,
+            offset       : int      = 0) -> None:
+        '''
+        Writes table as a parquet dataset partitioned by kind (for data) and block, such that
+        readers can load only the partitions they need. The schema of the table and the position
+        of each row are saved too, such that `_read_table` returns the same table
+
+        Parameters
+        ---------------
+        table       : Arrow table with samples
+        dataset_path: Path to directory where dataset will be written
+        basename    : If passed, files will be named after it and the files already in the dataset are kept.
+                      Used to write the dataset in chunks. By default, the partitions written are replaced
+        offset      : Position of the first row of `table` in the full table, needed when writing in chunks
+        '''
+        schema    = table.schema
+        arr_index = pa.array(numpy.arange(offset, offset + table.num_rows, dtype='int64'))
+        table     = table.append_column(self._index, arr_index)
+
+        os.makedirs(dataset_path, exist_ok=True)
+        # Files starting with underscore are not read as part of the dataset
+        with open(f'{dataset_path}/_schema.arrow', 'wb') as ofile:
+            ofile.write(schema.serialize().to_pybytes())
+
+        if table.num_rows == 0:
+            log.warning(f'Writing empty dataset to: {dataset_path}')
+            pq.write_table(table, f'{dataset_path}/part-0.parquet')
+            return
+
+        l_part = [ name for name in self._l_part if name in table.column_names ]
+        log.debug(f'Writing dataset partitioned by {l_part} to: {dataset_path}')
+
+        d_opt = {'existing_data_behavior' : 'delete_matching'}
+        if basename is not None:
+            d_opt = {
+                    'existing_data_behavior' : 'overwrite_or_ignore',
+                    'basename_template'      : f'{basename}-{{i}}.parquet'}
+
+        ds.write_dataset(
+                table,
+                base_dir              = dataset_path,
+                format                = 'parquet',
+                partitioning          = l_part,
+                partitioning_flavor   = 'hive',
+                min_rows_per_group    =  50_000,
+                max_rows_per_group    = 500_000,
+                **d_opt)
+    # --------------------------------
+    @classmethod
+    def _read_table(cls, dataset_path : str) -> pa.Table:
+        '''
+        Returns arrow table with all the partitions of the dataset, with the
+        columns, types and order of rows of the table written with `_write_table`
+        '''
+        with open(f'{dataset_path}/_schema.arrow', 'rb') as ifile:
+            schema = pa.ipc.read_schema(pa.py_buffer(ifile.read()))
+
+        l_field = [ schema.field(name) for name in cls._l_part if name in schema.names ]
+        part    = ds.partitioning(pa.schema(l_field), flavor='hive')
+        dataset = ds.dataset(
+                dataset_path,
+                format      = 'parquet',
+                partitioning= part,
+                schema      = schema.append(pa.field(cls._index, pa.int64())))
+
+        table   = dataset.to_table()
+        table   = table.sort_by(cls._index)
+
+        return table.select(schema.names)
+    # --------------------------------
+    def _save_cutflow(
+            self,
+            d_res   : dict[str|None,tuple],
+            elapsed : float,
+            nshared : int) -> None:
+        '''
+        Saves JSON file with the pass counts of each filter, per kind, and the time spent
+        in the event loop. The reports were booked with the branches, i.e. no extra event loop is needed
+
+        Parameters
+        -----------------
+        d_res  : Results booked with `_book_samples`, already filled
+        elapsed: Time in seconds spent in the event loop that filled the results
+        nshared: Number of splitters whose results were filled in that event loop, see `get_partitions`.
+                 The time is the one of the whole loop, i.e. it is not divided among them
+        '''
+        d_cutflow = {}
+        for kind, (_, rep) in d_res.items():
+            df_cut = ut.rdf_report_to_df(rep)
+            d_cutflow[kind or 'all'] = df_cut[['cut', 'All', 'Passed']].to_dict(orient='records')
+
+        data = {
+                'sample'  : self._sample,
+                'time'    : elapsed,
+                'shared'  : nshared,
+                'nruns'   : self._rdf.GetNRuns(),
+                'cutflow' : d_cutflow}
+
+        log.info(f'Event loop for {self._sample} took {elapsed:.1f} s, shared by {nshared} splitters')
+
+        gut.dump_json(data, f'{self._out_path}/cutflow.json', exists_ok=True)
+    # --------------------------------
+    @staticmethod
+    def _run_event_loop(l_res : list[tuple]) -> float:
+        '''
+        Parameters
+        -----------------
+        l_res: List of lazy results, see `_book`, booked on the same dataframe
+
+        Returns
+        -----------------
+        Time in seconds spent filling them, the event loop runs when the first of them is requested
+        '''
+        start = time.perf_counter()
+        for data, _ in l_res:
+            data.GetValue()
+
+        return time.perf_counter() - start
+    # --------------------------------
+    def _read_chunks(self, kind : str|None):
+        '''
+        Parameters
+        ---------------
+        kind: Kind of sample, e.g. PassFail, None for MC
+
+        Returns
+        ---------------
+        Generator of arrow tables with the entries of the temporary snapshot of `kind`,
+        each of them holding at most `max_memory` MB of branches. Nothing is returned for empty samples
+        '''
+        file_path = f'{self._tmp_dir}/{kind or "all"}.root'
+        step_size = f'{self._max_mem} MB'
+
+        if not os.path.isfile(file_path):
+            log.warning(f'No snapshot found for empty sample: {file_path}')
+            return
+
+        with uproot.open(file_path) as ifile:
+            tree = ifile['tree']
+            if tree.num_entries == 0:
+                log.warning(f'Empty snapshot found: {file_path}')
+                return
+
+            for d_data in tree.iterate(self._l_branch, step_size=step_size, library='np'):
+                yield pa.table({ name : pa.array(arr) for name, arr in d_data.items() })
+    # --------------------------------
+    def _get_empty_table(self) -> pa.Table:
+        '''
+        Returns table without entries, with all the branches read, with the types they would have if
+        they were read from the snapshots, see `_read_chunks`
+        '''
+        d_arr = {}
+        for name in self._l_branch:
+            ctype = str(self._rdf.GetColumnType(name))
+            if ctype not in self._d_dtype:
+                raise NotImplementedError(f'Unsupported type {ctype} of branch {name}')
+
+            d_arr[name] = pa.array(numpy.array([], dtype=self._d_dtype[ctype]))
+
+        return pa.table(d_arr)
+    # --------------------------------
+    def _stream_samples(
+            self,
+            dataset_path : str,
+            d_res        : dict[str|None,tuple]) -> None:
+        '''
+        Moves the snapshots booked with `_book_samples`, already filled, to the dataset in chunks,
+        such that at most `max_memory` MB of branches are held in memory at a time.
+        The dataset is the same as the one written by `_make_samples`, up to the split in files
+
+        Parameters
+        ---------------
+        dataset_path: Path to directory where the split samples will be saved
+        d_res       : Results booked with `_book_samples`
+        '''
+        hadron   = self._hadron_id if self._sample.startswith('DATA_') else self._hadron_from_sample()
+        nentries = 0
+        nbytes   = 0
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        for kind in d_res:
+            log.info(f'Streaming sample: {kind or "all"}')
+            for index, table in enumerate(self._read_chunks(kind=kind)):
+                if kind is not None:
+                    table = self._add_constant(table=table, name='kind', value=kind)
+                table = self._add_constant(table=table, name='hadron', value=hadron)
+
+                self._write_table(table=table, dataset_path=dataset_path, basename=f'{kind or "all"}-{index}', offset=nentries)
+                nentries += table.num_rows
+                nbytes   += sum(table.column(name).nbytes for name in self._l_branch)
+
+        # Empty samples are written with all the columns, such that readers find them
+        if nentries == 0:
+            table = self._get_empty_table()
+            if self._sample.startswith('DATA_'):
+                table = self._add_constant(table=table, name='kind', value='')
+            table = self._add_constant(table=table, name='hadron', value=hadron)
+            self._write_table(table=table, dataset_path=dataset_path)
+
+        shutil.rmtree(self._tmp_dir)
+        self._tmp_dir = None
+
+        self._save_branch_report(nentries=nentries, nbytes=nbytes)
+        self._cache()
+    # --------------------------------
+    def _make_samples(
+            self,
+            dataset_path : str,
+            d_res        : dict[str|None,tuple]|None = None,
+            loop         : tuple[float,int]|None     = None) -> pa.Table|None:
+        '''
+        Parameters
+        ---------------
+        dataset_path: Path to directory where the split samples will be saved
+        d_res       : Results booked with `_book_samples`, if not passed, they will be booked here
+        loop        : Tuple with time of event loop and number of splitters sharing it, if the results
+                      were already filled, see `get_partitions`. By default the event loop runs here
+
+        Returns
+        ---------------
+        Arrow table with split samples, after caching it.
+        If `max_memory` was specified, the samples are streamed to the dataset and None is returned
+        '''
+        if d_res is None:
+            d_res = self._book_samples()
+
+        if loop is None:
+            loop = self._run_event_loop(l_res=list(d_res.values())), 1
+
+        elapsed, nshared = loop
+        self._save_cutflow(d_res=d_res, elapsed=elapsed, nshared=nshared)
+
+        if self._max_mem is not None:
+            self._stream_samples(dataset_path=dataset_path, d_res=d_res)
+            return None
+
+        d_table = { kind : self._results_to_table(data=data, rep=rep) for kind, (data, rep) in d_res.items() }
+
+        if not self._sample.startswith('DATA_'):
+            table     = d_table[None]
+            table     = self._add_constant(table=table, name='hadron', value=self._hadron_from_sample())
+            self._write_table(table=table, dataset_path=dataset_path)
+            nbytes    = sum(table.column(name).nbytes for name in self._l_branch)
+            self._save_branch_report(nentries=table.num_rows, nbytes=nbytes)
+
+            self._cache()
+            return table
+
+        l_table = []
+        for kind, table in d_table.items():
+            log.info(f'Calculating sample: {kind}')
+            table = self._add_constant(table=table, name='kind', value=kind)
+            l_table.append(table)
+
+        # Concatenation only collects the chunks of each table, without copying them
+        table = pa.concat_tables(l_table)
+        table = self._add_constant(table=table, name='hadron', value=self._hadron_id)
+        self._write_table(table=table, dataset_path=dataset_path)
+        nbytes = sum(table.column(name).nbytes for name in self._l_branch)
+        self._save_branch_report(nentries=table.num_rows, nbytes=nbytes)
+
+        self._cache()
+
+        return table
+    # --------------------------------
+    def get_table(self) -> pa.Table:
+        '''
+        Returns arrow table with the samples described in `get_samples`,
+        read from the cache if available
+        '''
+        dataset_path = f'{self._out_path}/sample'
+        if self._copy_from_cache():
+            log.warning('Cached object found')
+            return self._read_table(dataset_path=dataset_path)
+
+        table = self._make_samples(dataset_path=dataset_path)
+        if table is None:
+            table = self._read_table(dataset_path=dataset_path)
+
+        return table
+    # --------------------------------
     def get_samples(self) -> pnd.DataFrame:
         '''
         For data: Returns pandas dataframe with data split by:
@@ -141,42 +595,84 @@ class SampleSplitter(Wcache):
 
         For MC: It will only filter by charge and return dataframe without
         PassFail, etc split
+
+        The dataframe is built from the arrow table returned by `get_table`
         '''
-        parquet_path = f'{self._out_path}/sample.parquet'
+        table = self.get_table()
+
+        return self._to_pandas(table=table)
+    # --------------------------------
+    def get_path(self) -> str:
+        '''
+        Returns path to directory with the parquet dataset holding the samples described in `get_samples`.
+        The dataset is partitioned, hive style, by kind (for data) and block.
+        The samples are made and cached only if they are not in the cache already.
+        Meant to be used to process the samples without loading them fully in memory.
+        '''
+        dataset_path = f'{self._out_path}/sample'
         if self._copy_from_cache():
             log.warning('Cached object found')
-            df = pnd.read_parquet(parquet_path, engine='pyarrow')
-
-            return df
+            return dataset_path
 
-        l_df = []
-        self._rdf = self._filter_rdf(rdf=self._rdf)
+        self._make_samples(dataset_path=dataset_path)
 
-        if not self._sample.startswith('DATA_'):
-            df = self._rdf_to_df(rdf=self._rdf)
-            df['hadron'] = self._hadron_from_sample()
-            df.to_parquet(parquet_path, engine='pyarrow')
+        return dataset_path
+    # --------------------------------
+    @classmethod
+    def get_partitions(
+            cls,
+            rdf    : RDataFrame,
+            sample : str,
+            cfg    : dict,
+            name   : str = '') -> dict[tuple[bool,str],pnd.DataFrame]:
+        '''
+        Splits the sample for both B charges and all the hadrons in `hadron_tagging`,
+        reading the input only once. The partitions that are not cached are booked on the same
+        dataframe and filled in a single event loop. Each partition is cached as it would be
+        by `get_samples`
 
-            self._cache()
-            return df
+        Parameters
+        ---------------
+        rdf   : See __init__
+        sample: See __init__
+        cfg   : See __init__
+        name  : See __init__
 
-        for kind in self._l_kind:
-            log.info(f'Calculating sample: {kind}')
-            rdf            = self._rdf
-            cut_os, cut_ss = self._get_cuts(kind=kind)
+        Returns
+        ---------------
+        Dictionary mapping (is_bplus, hadron_id) to dataframe, as returned by `get_samples`
+        '''
+        d_spl = {}
+        for is_bplus in [True, False]:
+            for hadron_id in cfg['hadron_tagging']:
+                d_spl[(is_bplus, hadron_id)] = cls(
+                        rdf      = rdf,
+                        sample   = sample,
+                        hadron_id= hadron_id,
+                        is_bplus = is_bplus,
+                        cfg      = cfg,
+                        name     = name)
 
-            rdf = rdf.Filter(cut_os, f'OS {kind}')
-            rdf = rdf.Filter(cut_ss, f'SS {kind}')
+        d_res = {}
+        d_tab = {}
+        for key, spl in d_spl.items():
+            if spl._copy_from_cache():
+                log.warning(f'Cached object found for: {key}')
+                d_tab[key] = cls._read_table(dataset_path=f'{spl._out_path}/sample')
+                continue
 
-            df = self._rdf_to_df(rdf=rdf)
-            df['kind'] = kind
-            l_df.append(df)
+            d_res[key] = spl._book_samples()
 
-        df_tot           = pnd.concat(l_df)
-        df_tot['hadron'] = self._hadron_id
-        df_tot.to_parquet(parquet_path, engine='pyarrow')
+        log.info(f'Making {len(d_res)} partitions in one event loop')
+        l_res   = [ res for d_kind in d_res.values() for res in d_kind.values() ]
+        elapsed = cls._run_event_loop(l_res=l_res)
+        for key, d_kind in d_res.items():
+            spl        = d_spl[key]
+            table      = spl._make_samples(dataset_path=f'{spl._out_path}/sample', d_res=d_kind, loop=(elapsed, len(d_res)))
+            if table is None:
+                table  = cls._read_table(dataset_path=f'{spl._out_path}/sample')
 
-        self._cache()
+            d_tab[key] = table
 
-        return df_tot
+        return { key : cls._to_pandas(table=d_tab[key]) for key in d_spl }
 # --------------------------------
@@ -3,14 +3,17 @@ Module with SampleWeighter class
 '''
 import os
 import re
-import glob
-import math
-import pickle
 
+import numpy
 import pandas  as pnd
-from boost_histogram        import Histogram    as bh
-from boost_histogram        import accumulators as acc
+import pyarrow         as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 from dmu.logging.log_store  import LogStore
+from rx_misid.efficiency_map import EfficiencyMap
+from rx_misid.anomaly_counter import AnomalyCounter
+from rx_misid                 import efficiency_kernel as ekr
+from rx_misid.map_repository import MapRepository
 
 log=LogStore.add_logger('rx_misid:sample_weighter')
 # ------------------------------
@@ -28,12 +31,15 @@ class SampleWeighter:
             df     : pnd.DataFrame,
             is_sig : bool,
             sample : str,
-            cfg    : dict):
+            cfg    : dict,
+            d_index: dict[tuple,numpy.ndarray]|None = None):
         '''
-        df    : Pandas dataframe with columns 'hadron', 'bmeson' and 'kind'. Used to assign weights
-        is_sig: If true, the weights will provide signal region sample, otherwise control region
-        sample: E.g. DATA_24_... Needed to pick maps based on actual particle identity
-        cfg   : Dictionary storing configuration
+        df     : Pandas dataframe with columns 'hadron', 'bmeson' and 'kind'. Used to assign weights
+        is_sig : If true, the weights will provide signal region sample, otherwise control region
+        sample : E.g. DATA_24_... Needed to pick maps based on actual particle identity
+        cfg    : Dictionary storing configuration
+        d_index: Cache of bin indices of another weighter of the same dataframe, to be reused, see `_get_bin_indices`.
+                 By default a new cache is used
         '''
         self._cfg    = cfg
         self._is_sig = is_sig
@@ -45,12 +51,16 @@ class SampleWeighter:
         self._l_hadron_sample   = ['Bu_piplpimnKpl_eq_sqDalitz_DPC']
         self._regex             = r'.*_(block\d)(?:_v\d)?-(?:up|down)-(K|Pi)-.*'
 
-        self._d_out_of_map : dict[str,dict[int,int]] = {}
+        self._counter      = AnomalyCounter()
+        self._d_toy        : dict[str,numpy.ndarray] = {}
+        self._d_index      : dict[tuple,numpy.ndarray] = {} if d_index is None else d_index
 
         self._set_variables()
-        self._df                           = self._get_df(df)
-        self._d_map        : dict[str, bh] = self._load_maps()
-        self._true_electron                = self._is_true_electron()
+        self._df                                     = self._get_df(df)
+        self._arr_wgt                                = self._df['weight'].to_numpy(copy=True)
+        self._true_electron                          = self._is_true_electron()
+        self._d_map        : dict[str,EfficiencyMap] = self._load_maps()
+        self._d_cut        : dict[str,str]           = self._get_region_cuts() if self._true_electron else {}
     # ------------------------------
     def _is_true_electron(self) -> bool:
         '''
@@ -74,6 +84,94 @@ class SampleWeighter:
 
         raise NotImplementedError(f'Cannot obtain efficiency for {self._sample} sample')
     # ------------------------------
+    def _get_region_cuts(self) -> dict[str,str]:
+        '''
+        Translates the cuts defining the signal and control regions
+        into expressions on the columns of the dataframe, for each lepton.
+        These expressions can be evaluated with `eval` on a candidate or with `DataFrame.eval`
+        on all the candidates.
+
+        Returns
+        -------------
+        Dictionary with keys like `L1_signal` and values as the expressions
+        '''
+        d_cut = {}
+        for lep in ['L1', 'L2']:
+            for region in ['signal', 'control']:
+                cut = self._translate_cut(cut=self._cfg['regions'][region], lep=lep)
+
+                self._check_cut_columns(cut=cut)
+                log.debug(f'{lep}/{region}: {cut}')
+
+                d_cut[f'{lep}_{region}'] = cut
+
+        return d_cut
+    # ------------------------------
+    @staticmethod
+    def _translate_cut(cut : str, lep : str) -> str:
+        '''
+        Parameters
+        -------------
+        cut: Cut defining a region in the config, e.g. (PROBNN_E>0.2)&(DLLe>3.0)
+        lep: Lepton, e.g. L1
+
+        Returns
+        -------------
+        Expression on the columns of the dataframe, e.g. (L1_PROBNN_E>0.2) and (L1_PID_E>3.0)
+        '''
+        cut = cut.replace('DLLe'    , f'{lep}_PID_E')
+        cut = cut.replace('PROBNN_E', f'{lep}_PROBNN_E')
+        cut = cut.replace('|',  ' or ')
+        cut = cut.replace('&', ' and ')
+
+        return cut
+    # ------------------------------
+    @staticmethod
+    def _get_names(expr : str) -> set[str]:
+        '''
+        Returns names of variables used in expression, i.e. excluding functions and keywords
+        '''
+        l_match = re.findall(r'(?<![\w.])([A-Za-z_]\w*)(\s*\()?', expr)
+        s_name  = { name for name, call in l_match if call == '' }
+
+        return s_name - {'and', 'or', 'not'}
+    # ------------------------------
+    @classmethod
+    def get_columns(cls, cfg : dict) -> set[str]:
+        '''
+        Parameters
+        -------------
+        cfg: Dictionary storing configuration, see __init__
+
+        Returns
+        -------------
+        Names of the columns of the input dataframe that can be needed for weighting,
+        including the ones needed by variants, if any. Depending on the sample, some of them,
+        e.g. `kind`, might not be present
+        '''
+        s_name = {'block', 'hadron', 'kind', 'weight'}
+        l_cfg  = [cfg] + list(cfg.get('variants', {}).values())
+        for lep in ['L1', 'L2']:
+            for var in cfg['pars']:
+                s_name |= cls._get_names(var.replace('PARTICLE', lep))
+
+            for cfg_var in l_cfg:
+                for cut in cfg_var.get('regions', {}).values():
+                    s_name |= cls._get_names(cls._translate_cut(cut=cut, lep=lep))
+
+        return s_name
+    # ------------------------------
+    def _check_cut_columns(self, cut : str) -> None:
+        '''
+        Raises exception if the cut uses columns missing in the dataframe
+        '''
+        s_name   = self._get_names(cut)
+        l_missing= sorted(s_name - set(self._df.columns))
+        if len(l_missing) == 0:
+            return
+
+        raise ValueError(f'Cannot evaluate cut {cut}, missing branches: {l_missing}')
+    # ------------------------------
     def _get_df(self, df : pnd.DataFrame) -> pnd.DataFrame:
         df = self._add_columns(df=df, particle='L1')
         df = self._add_columns(df=df, particle='L2')
@@ -111,21 +209,58 @@ class SampleWeighter:
 
         return f'{block}_{part}_{region}'
     # ------------------------------
-    def _load_maps(self) -> dict[str, bh]:
+    def _get_needed_keys(self) -> set[str]:
+        '''
+        Returns
+        -------------
+        Set of keys, e.g. block1_kaon_signal, of the maps needed to weight
+        the candidates in the dataframe
+        '''
+        if self._true_electron or len(self._df) == 0:
+            return set()
+
+        if   not self._sample.startswith('DATA_'):
+            l_region = ['signal', 'control']
+        elif self._is_sig:
+            l_region = ['signal', 'control']
+        else:
+            l_region = ['control']
+
+        l_block  = [ int(block) for block in self._df['block'].unique() ]
+        l_hadron = self._df['hadron'].unique().tolist()
+
+        s_key = { f'block{block}_{hadron}_{region}' for block in l_block for hadron in l_hadron for region in l_region }
+
+        return s_key
+    # ------------------------------
+    def _load_maps(self) -> dict[str,EfficiencyMap]:
+        '''
+        Returns
+        -------------
+        Dictionary mapping key, e.g. block1_kaon_signal, to map converted to dense arrays.
+        Only the maps needed for the blocks, hadrons and regions in the inputs are loaded.
+        Maps are only read once per process, see MapRepository
+        '''
+        s_key   = self._get_needed_keys()
+        if len(s_key) == 0:
+            log.debug('No maps needed')
+            return {}
+
         pkl_dir = self._cfg['path']
-        path_wc = f'{pkl_dir}/*.pkl'
 
         d_map = {}
-        for path in glob.glob(path_wc):
+        for path in MapRepository.get_paths(pkl_dir=pkl_dir):
             key = self._key_from_path(path)
+            if key not in s_key:
+                continue
+
+            d_map[key] = MapRepository.get_map(path=path)
 
-            with open(path, 'rb') as ifile:
-                try:
-                    hist = pickle.load(ifile)
-                except EOFError as exc:
-                    raise EOFError(f'Cannot open map: {path}') from exc
+        l_missing = sorted(s_key - set(d_map))
+        if len(l_missing) > 0:
+            raise ValueError(f'Cannot find maps in {pkl_dir} for: {l_missing}')
 
-            d_map[key] = hist
+        log.debug(f'Loaded {len(d_map)} maps')
 
         return d_map
     # ------------------------------
@@ -138,30 +273,34 @@ class SampleWeighter:
         self._vary = l_var[1]
     # ------------------------------
     def _get_bin_index(self,
-                       hist  : bh,
+                       emap  : EfficiencyMap,
                        iaxis : int,
                        value : float,
-                       name  : str) -> int:
-        axis = hist.axes[iaxis]
-        minv = axis.edges[ 0] * 1.001
-        maxv = axis.edges[-1] * 0.999
+                       name  : str,
+                       where : tuple[int,str,str]) -> int:
+        '''
+        where: Block, hadron and region of the map, used to count candidates outside map
+
+        Raises ValueError if the value is NaN, as `_get_bin_indices` does
+        '''
+        if numpy.isnan(value):
+            raise ValueError(f'Found NaN value in {name}, cannot find bin in map')
+
+        edges= emap.edges(iaxis)
+        minv = edges[ 0] * 1.001
+        maxv = edges[-1] * 0.999
 
         old_value = value
         new_value = max(old_value, minv)
         new_value = min(new_value, maxv)
 
         if old_value != new_value:
-            #log.debug(f'Moving {name} value inside map {old_value:.5f} -> {new_value:.5f}')
+            category = 'above_map' if old_value > maxv else 'below_map'
+            self._counter.add(*where, variable=name, category=category, count=1)
 
-            is_max = old_value > maxv
-            if name not in self._d_out_of_map:
-                self._d_out_of_map[name] = {True : 0, False : 0}
+        index = numpy.searchsorted(edges, new_value, side='right') - 1
 
-            self._d_out_of_map[name][is_max] += 1
-
-        index = axis.index(new_value)
-
-        return index
+        return int(index)
     # ------------------------------
     def _get_lepton_eff(
             self,
@@ -202,11 +341,7 @@ class SampleWeighter:
         '''
         # TODO: Replace this section with efficiency maps for electrons, when available
         region = {True : 'signal', False : 'control'}[is_sig]
-        cut    = self._cfg['regions'][region]
-        cut    = cut.replace('DLLe'    , f'{lep}_PID_E')
-        cut    = cut.replace('PROBNN_E', f'{lep}_PROBNN_E')
-        cut    = cut.replace('|',  ' or ')
-        cut    = cut.replace('&', ' and ')
+        cut    = self._d_cut[f'{lep}_{region}']
 
         data   = row.to_dict()
         try:
@@ -238,8 +373,10 @@ class SampleWeighter:
         Lepton PID efficiency
         '''
         block   = int(row.block)
-        key_map = f'block{block}_{row.hadron}_signal' if is_sig else f'block{block}_{row.hadron}_control'
-        hist    = self._d_map[key_map]
+        region  = 'signal' if is_sig else 'control'
+        key_map = f'block{block}_{row.hadron}_{region}'
+        emap    = self._d_map[key_map]
+        where   = block, row.hadron, region
 
         varx = self._varx.replace('PARTICLE', lep)
         vary = self._vary.replace('PARTICLE', lep)
@@ -247,70 +384,13 @@ class SampleWeighter:
         x_value = getattr(row, varx)
         y_value = getattr(row, vary)
 
-        ix = self._get_bin_index(hist, iaxis=0, value=x_value, name=varx)
-        iy = self._get_bin_index(hist, iaxis=1, value=y_value, name=vary)
-        eff= hist[ix, iy]
-
-        if isinstance(eff, acc.WeightedSum):
-            eff = eff.value
-
-        if not isinstance(eff, float):
-            etype = type(eff)
-            raise NotImplementedError(f'Unrecognized efficiency of type: {etype}')
+        ix = self._get_bin_index(emap, iaxis=0, value=x_value, name=varx, where=where)
+        iy = self._get_bin_index(emap, iaxis=1, value=y_value, name=vary, where=where)
+        eff= emap.values[ix, iy]
 
-        eff = self._check_eff(eff=eff, x=x_value, y=y_value)
+        self._counter.add_flags(*where, variable=lep, arr_flag=emap.flags[ix, iy])
 
-        return eff
-    # ------------------------------
-    def _check_eff(self, eff : float, x : float, y : float) -> float:
-        '''
-        Parameters
-        ---------------
-        eff: Efficiency
-        x/y: Coordinates in map associated to efficiency
-
-        Returns
-        ---------------
-        efficiency after sanitation step
-        '''
-        if 0 <= eff <= 1:
-            return eff
-
-        if math.isnan(eff):
-            log.warning('At:')
-            log.warning(f'X={x:.2f}')
-            log.warning(f'Y={y:.2f}')
-            log.warning(f'Eff={eff:0.3} returning 0')
-
-            return 0.0
-
-        log.debug('At:')
-        log.debug(f'X={x:.2f}')
-        log.debug(f'Y={y:.2f}')
-        log.info(f'Eff={eff:0.3}')
-
-        if eff < 0:
-            return 0.0
-
-        if eff > 1:
-            return 1.0
-
-        raise ValueError(f'Unexpected efficiency value: {eff}')
-    # ------------------------------
-    def _print_info_from_row(self, row : pnd.Series) -> None:
-        log.info(40 * '-')
-        log.info(f'Block/Hadron: {row.block}/{row.hadron}')
-        log.info(40 * '-')
-        for lepton in ['L1', 'L2']:
-            varx = self._varx.replace('PARTICLE', lepton)
-            vary = self._vary.replace('PARTICLE', lepton)
-
-            valx = getattr(row, varx)
-            valy = getattr(row, vary)
-
-            log.info(f'{varx:<20}{valx:20.2f}')
-            log.info(f'{vary:<20}{valy:20.2f}')
-            log.info('')
+        return float(eff)
     # ------------------------------
     def _get_transfer_weight(self, row : pnd.Series) -> float:
         '''
@@ -347,8 +427,13 @@ class SampleWeighter:
         trf_eff = self._get_data_candidate_efficiency(row=row, is_sig=self._is_sig)
         ctr_eff = self._get_data_candidate_efficiency(row=row, is_sig=       False)
         if ctr_eff == 0:
-            log.warning('Control efficiency is zero at:')
-            self._print_info_from_row(row)
+            self._counter.add(
+                    block   = row.block,
+                    hadron  = row.hadron,
+                    region  = 'control',
+                    variable= row.kind,
+                    category= 'zero_denominator',
+                    count   = 1)
             return 1
 
         return trf_eff / ctr_eff
@@ -398,31 +483,620 @@ class SampleWeighter:
 
         return eff
     # ------------------------------
-    def get_weighted_data(self) -> pnd.DataFrame:
+    def _get_bin_indices(
+            self,
+            emap      : EfficiencyMap,
+            iaxis     : int,
+            arr_value : numpy.ndarray,
+            arr_row   : numpy.ndarray,
+            name      : str,
+            where     : tuple[int,str,str]) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_bin_index`
+
+        Parameters
+        ----------------
+        emap     : Efficiency map
+        iaxis    : Index of axis in map, 0 for x, 1 for y
+        arr_value: Array with coordinates of candidates along that axis
+        arr_row  : Array with the positions in the dataframe of the candidates in `arr_value`
+        name     : Name of variable, used to count candidates outside map
+        where    : Block, hadron and region of the map, used to count candidates outside map
+
+        Returns
+        ----------------
+        Array with bin indices, after moving values outside the map to its edges.
+        The indices are cached per variable, candidates and binning, such that
+        maps with the same binning, e.g. other regions or variants, reuse them.
+        Raises ValueError if any value is NaN, as `_get_bin_index` does
+        '''
+        if numpy.isnan(arr_value).any():
+            nnan = numpy.isnan(arr_value).sum()
+            raise ValueError(f'Found {nnan} NaN values in {name}, cannot find bin in map')
+
+        self._count_out_of_map(emap=emap, iaxis=iaxis, arr_value=arr_value, name=name, where=where)
+
+        arr_edge = emap.edges(iaxis)
+        key      = name, arr_row.tobytes(), arr_edge.tobytes()
+        if key in self._d_index:
+            return self._d_index[key]
+
+        minv     = arr_edge[ 0] * 1.001
+        maxv     = arr_edge[-1] * 0.999
+
+        arr_value = numpy.clip(arr_value, minv, maxv)
+        arr_index = numpy.searchsorted(arr_edge, arr_value, side='right') - 1
+
+        self._d_index[key] = arr_index
+
+        return arr_index
+    # ------------------------------
+    def _count_out_of_map(
+            self,
+            emap      : EfficiencyMap,
+            iaxis     : int,
+            arr_value : numpy.ndarray,
+            name      : str,
+            where     : tuple[int,str,str]) -> None:
+        '''
+        Counts candidates outside of map, for arguments see `_get_bin_indices`
+        '''
+        arr_edge = emap.edges(iaxis)
+        minv     = arr_edge[ 0] * 1.001
+        maxv     = arr_edge[-1] * 0.999
+
+        nlow     = numpy.count_nonzero(arr_value < minv)
+        nhigh    = numpy.count_nonzero(arr_value > maxv)
+        self._counter.add(*where, variable=name, category='below_map', count=nlow )
+        self._counter.add(*where, variable=name, category='above_map', count=nhigh)
+    # ------------------------------
+    def _get_values(self, key_map : str) -> numpy.ndarray:
+        '''
+        Returns
+        ---------------
+        Array of efficiencies for a given map, with shape (nx, ny) or (ntoys, nx, ny)
+        if toys are being evaluated
+        '''
+        if key_map in self._d_toy:
+            return self._d_toy[key_map]
+
+        return self._d_map[key_map].values
+    # ------------------------------
+    def _get_shape(self, nentries : int) -> tuple[int,...]:
+        '''
+        Returns
+        ---------------
+        Shape of arrays of efficiencies, (nentries,) or (ntoys, nentries) if toys are being evaluated
+        '''
+        if len(self._d_toy) == 0:
+            return (nentries,)
+
+        arr_toy = next(iter(self._d_toy.values()))
+        ntoys   = arr_toy.shape[0]
+
+        return ntoys, nentries
+    # ------------------------------
+    def _get_lepton_effs(
+            self,
+            lep    : str,
+            is_sig : bool,
+            mask   : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_lepton_eff`
+
+        Parameters
+        -----------------
+        lep   : L1 or L2
+        is_sig: If True will provide signal region efficiencies
+        mask  : Array of booleans, selecting the candidates for which the efficiency is needed
+
+        Returns
+        -----------------
+        Array with efficiencies for the selected candidates
+        '''
+        if self._true_electron:
+            return self._get_true_lepton_effs(lep=lep, is_sig=is_sig, mask=mask)
+
+        return self._get_fake_lepton_effs(lep=lep, is_sig=is_sig, mask=mask)
+    # ------------------------------
+    def _get_true_lepton_effs(
+            self,
+            lep    : str,
+            is_sig : bool,
+            mask   : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_true_lepton_eff`, the region cut
+        is evaluated on the whole dataframe as a boolean mask
+
+        Parameters
+        --------------------
+        lep   : E.g. L1 or L2
+        is_sig: If true, need the efficiency for signal region cut, otherwise, control region.
+        mask  : Array of booleans, selecting the candidates for which the efficiency is needed
+
+        Returns
+        --------------------
+        Array of 0s and 1s, depending on wether the cut passes or fails
+        '''
+        region = {True : 'signal', False : 'control'}[is_sig]
+        cut    = self._d_cut[f'{lep}_{region}']
+
+        try:
+            arr_flag = self._df.eval(cut).to_numpy(dtype=bool)
+        except Exception as exc:
+            raise ValueError(f'Cannot evaluate {cut} on dataframe') from exc
+
+        return arr_flag[mask].astype(float)
+    # ------------------------------
+    def _get_fake_lepton_effs(
+            self,
+            lep    : str,
+            is_sig : bool,
+            mask   : numpy.ndarray) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_fake_lepton_eff`. Candidates are grouped by block and hadron
+        and the efficiencies are gathered from the values of the corresponding map.
+
+        Parameters
+        ----------------
+        lep   : L1 or L2
+        is_sig: Used to pick correct efficiency map
+        mask  : Array of booleans, selecting the candidates for which the efficiency is needed
+
+        Returns
+        ----------------
+        Array with lepton PID efficiencies for the selected candidates
+        '''
+        region = {True : 'signal', False : 'control'}[is_sig]
+        varx   = self._varx.replace('PARTICLE', lep)
+        vary   = self._vary.replace('PARTICLE', lep)
+
+        arr_x  = self._df[varx].to_numpy(dtype=float)[mask]
+        arr_y  = self._df[vary].to_numpy(dtype=float)[mask]
+        arr_row= numpy.flatnonzero(mask)
+        df_grp = pnd.DataFrame({
+            'block' : self._df['block' ].to_numpy()[mask],
+            'hadron': self._df['hadron'].to_numpy()[mask]})
+
+        arr_eff = numpy.zeros(self._get_shape(len(df_grp)))
+        for (block, hadron), arr_ind in df_grp.groupby(['block', 'hadron']).indices.items():
+            key_map = f'block{int(block)}_{hadron}_{region}'
+            emap    = self._d_map[key_map]
+            where   = int(block), hadron, region
+
+            arr_ix  = self._get_bin_indices(emap, iaxis=0, arr_value=arr_x[arr_ind], arr_row=arr_row[arr_ind], name=varx, where=where)
+            arr_iy  = self._get_bin_indices(emap, iaxis=1, arr_value=arr_y[arr_ind], arr_row=arr_row[arr_ind], name=vary, where=where)
+
+            arr_eff[..., arr_ind] = self._get_values(key_map)[..., arr_ix, arr_iy]
+            self._counter.add_flags(*where, variable=lep, arr_flag=emap.flags[arr_ix, arr_iy])
+
+        return arr_eff
+    # ------------------------------
+    def _get_data_candidate_efficiencies(self, is_sig : bool) -> numpy.ndarray:
         '''
-        Returns instance of weighted data
+        Vectorized version of `_get_data_candidate_efficiency`
+
+        Parameters
+        ------------------
+        is_sig: If true the probability is for the signal region
+
+        Returns
+        ------------------
+        Array with probabilities for the candidates to be in the signal or control region
+        '''
+        arr_kind = self._df['kind'].to_numpy()
+        arr_l1   = numpy.isin(arr_kind, ['FailPass', 'FailFail'])
+        arr_l2   = numpy.isin(arr_kind, ['PassFail', 'FailFail'])
+
+        arr_bad  = ~(arr_l1 | arr_l2)
+        if arr_bad.any():
+            l_kind = numpy.unique(arr_kind[arr_bad]).tolist()
+            raise ValueError(f'Invalid kinds: {l_kind}')
+
+        arr_eff1 = numpy.ones(self._get_shape(len(arr_kind)))
+        arr_eff2 = numpy.ones(self._get_shape(len(arr_kind)))
+
+        arr_eff1[..., arr_l1] = self._get_lepton_effs(lep='L1', is_sig=is_sig, mask=arr_l1)
+        arr_eff2[..., arr_l2] = self._get_lepton_effs(lep='L2', is_sig=is_sig, mask=arr_l2)
+
+        return arr_eff1 * arr_eff2
+    # ------------------------------
+    def _get_map_indices(
+            self,
+            emap    : EfficiencyMap,
+            d_value : dict[str,numpy.ndarray],
+            arr_row : numpy.ndarray,
+            where   : tuple[int,str,str],
+            index   : tuple[numpy.ndarray,...]|None) -> tuple[numpy.ndarray,...]:
+        '''
+        Parameters
+        ----------------
+        emap   : Efficiency map
+        d_value: Dictionary mapping variable name, e.g. L1_TRACK_ETA, to array of values
+        arr_row: Array with the positions in the dataframe of the candidates in `d_value`
+        where  : Block, hadron and region of the map
+        index  : Indices already calculated for a map with the same binning, if any, None otherwise
+
+        Returns
+        ----------------
+        Tuple with bin indices (ix1, iy1, ix2, iy2) for both leptons
+        '''
+        l_name = [ var.replace('PARTICLE', lep) for lep in ['L1', 'L2'] for var in [self._varx, self._vary] ]
+        if index is None:
+            return tuple(self._get_bin_indices(emap, iaxis=ivar % 2, arr_value=d_value[name], arr_row=arr_row, name=name, where=where) for ivar, name in enumerate(l_name))
+
+        for ivar, name in enumerate(l_name):
+            self._count_out_of_map(emap, iaxis=ivar % 2, arr_value=d_value[name], name=name, where=where)
+
+        return index
+    # ------------------------------
+    def _get_fake_region_efficiencies(self) -> tuple[numpy.ndarray,numpy.ndarray]:
+        '''
+        Calculates the four lepton efficiencies, L1/L2 x signal/control, for all the candidates
+        with a single gather per (block, hadron) group, see `efficiency_kernel`
+
+        Returns
+        ---------------
+        Tuple with arrays of efficiencies in signal and control regions
+        '''
+        l_name = [ var.replace('PARTICLE', lep) for lep in ['L1', 'L2'] for var in [self._varx, self._vary] ]
+        d_arr  = { name : self._df[name].to_numpy(dtype=float) for name in l_name }
+        df_grp = self._df[['block', 'hadron']]
+
+        eff_sig = numpy.zeros(self._get_shape(len(self._df)))
+        eff_ctr = numpy.zeros(self._get_shape(len(self._df)))
+        for (block, hadron), arr_ind in df_grp.groupby(['block', 'hadron']).indices.items():
+            sig_key = f'block{int(block)}_{hadron}_signal'
+            ctr_key = f'block{int(block)}_{hadron}_control'
+            sig_map = self._d_map[sig_key]
+            ctr_map = self._d_map[ctr_key]
+            d_value = { name : arr[arr_ind] for name, arr in d_arr.items() }
+
+            same_binning = all(numpy.array_equal(sig_map.edges(iaxis), ctr_map.edges(iaxis)) for iaxis in [0, 1])
+
+            sig_index = self._get_map_indices(sig_map, d_value=d_value, arr_row=arr_ind, where=(int(block), hadron, 'signal' ), index=None)
+            ctr_index = self._get_map_indices(ctr_map, d_value=d_value, arr_row=arr_ind, where=(int(block), hadron, 'control'), index=sig_index if same_binning else None)
+
+            for emap, index, region in [(sig_map, sig_index, 'signal'), (ctr_map, ctr_index, 'control')]:
+                ix1, iy1, ix2, iy2 = index
+                self._counter.add_flags(int(block), hadron, region, variable='L1', arr_flag=emap.flags[ix1, iy1])
+                self._counter.add_flags(int(block), hadron, region, variable='L2', arr_flag=emap.flags[ix2, iy2])
+
+            arr_sig, arr_ctr = ekr.get_region_efficiencies(
+                    sig_values = self._get_values(sig_key),
+                    ctr_values = self._get_values(ctr_key),
+                    sig_index  = sig_index,
+                    ctr_index  = ctr_index)
+
+            eff_sig[..., arr_ind] = arr_sig
+            eff_ctr[..., arr_ind] = arr_ctr
+
+        return eff_sig, eff_ctr
+    # ------------------------------
+    def _get_mc_region_efficiencies(self) -> tuple[numpy.ndarray,numpy.ndarray]:
+        '''
+        Returns
+        ---------------
+        Tuple with arrays of efficiencies in signal and control regions, for all the candidates
+        '''
+        if not self._true_electron:
+            return self._get_fake_region_efficiencies()
+
+        mask   = numpy.ones(len(self._df), dtype=bool)
+
+        eff_p1 = self._get_true_lepton_effs(lep='L1', is_sig= True, mask=mask)
+        eff_p2 = self._get_true_lepton_effs(lep='L2', is_sig= True, mask=mask)
+        eff_f1 = self._get_true_lepton_effs(lep='L1', is_sig=False, mask=mask)
+        eff_f2 = self._get_true_lepton_effs(lep='L2', is_sig=False, mask=mask)
+
+        return ekr.combine(eff_p1, eff_p2, eff_f1, eff_f2)
+    # ------------------------------
+    def _get_mc_candidate_efficiencies(self, is_sig : bool) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_mc_candidate_efficiency`
+
+        Parameter
+        ---------------
+        is_sig: If true, efficiencies are for the signal region, otherwise control region
+
+        Returns
+        ---------------
+        Array with efficiencies associated to either signal or control region
+        '''
+        eff_sig, eff_ctr = self._get_mc_region_efficiencies()
+
+        return eff_sig if is_sig else eff_ctr
+    # ------------------------------
+    def _count_zero_denominators(self, arr_zero : numpy.ndarray) -> None:
+        '''
+        Parameters
+        ---------------
+        arr_zero: Array of booleans, true for candidates with zero efficiency in the control region
+        '''
+        if not arr_zero.any():
+            return
+
+        df = self._df.loc[arr_zero, ['block', 'hadron', 'kind']]
+        for (block, hadron, kind), count in df.value_counts().items():
+            self._counter.add(
+                    block   = block,
+                    hadron  = hadron,
+                    region  = 'control',
+                    variable= kind,
+                    category= 'zero_denominator',
+                    count   = count)
+    # ------------------------------
+    def _get_transfer_weights(self) -> numpy.ndarray:
+        '''
+        Vectorized version of `_get_transfer_weight`, acting on all the candidates at once
+
+        Returns
+        ---------------
+        Array with weights used to _transfer_ candidates in PID control region to signal region
+        '''
+        if not self._sample.startswith('DATA_'):
+            return self._get_mc_candidate_efficiencies(is_sig=self._is_sig)
+
+        arr_trf = self._get_data_candidate_efficiencies(is_sig=self._is_sig)
+        arr_ctr = self._get_data_candidate_efficiencies(is_sig=       False)
+
+        arr_zero = arr_ctr == 0
+        if arr_zero.ndim == 1:
+            self._count_zero_denominators(arr_zero=arr_zero)
+
+        arr_ctr  = numpy.where(arr_zero, 1.0, arr_ctr)
+        arr_wgt  = numpy.where(arr_zero, 1.0, arr_trf / arr_ctr)
+
+        return arr_wgt
+    # ------------------------------
+    def _get_variant_weights(self) -> dict[str,numpy.ndarray]:
+        '''
+        Weights candidates with each of the variants in the `variants` section of the config, if any.
+        Each variant is a dictionary overriding entries of the config, e.g. `path` or `regions`.
+        Maps are loaded once per process and bin indices are shared with the nominal weighting when
+        the binning is the same.
+
+        Returns
+        ---------------
+        Dictionary mapping name of variant to array with input weights multiplied by transfer weights
+        '''
+        d_variant = self._cfg.get('variants', {})
+        d_weight  = {}
+        for name, d_override in d_variant.items():
+            cfg = {key : val for key, val in self._cfg.items() if key != 'variants'}
+            cfg.update(d_override)
+
+            log.info(f'Weighting with variant: {name}')
+            obj            = SampleWeighter(df=self._df, is_sig=self._is_sig, sample=self._sample, cfg=cfg, d_index=self._d_index)
+            d_weight[name] = obj._get_transfer_weights() * self._arr_wgt
+
+            obj._counter.log_summary()
+
+        return d_weight
+    # ------------------------------
+    def _weight(self, vectorized : bool) -> pnd.DataFrame:
+        '''
+        Weights dataframe, see `get_weighted_data`, without logging summary
         '''
         if len(self._df) == 0:
             log.warning('Empty dataframe, not assigning any weight')
+            # Same types as the weights of non-empty dataframes
+            self._df['weight'] = self._df['weight'].astype(float)
+            for name in self._cfg.get('variants', {}):
+                self._df[f'weight_{name}'] = self._df['weight']
+
             return self._df
 
         try:
-            self._df['weight'] *= self._df.apply(self._get_transfer_weight, axis=1)
-        except AttributeError as exc:
+            d_weight = self._get_variant_weights()
+            if vectorized:
+                self._df['weight'] *= self._get_transfer_weights()
+            else:
+                self._df['weight'] *= self._df.apply(self._get_transfer_weight, axis=1)
+        except (AttributeError, KeyError) as exc:
             log.info(self._df.dtypes)
             log.info(self._df.columns)
             log.info(self._df)
             raise AttributeError('Cannot assign weight') from exc
 
-        log.info(f'Processed {len(self._df)} entries')
-        log.info(40 * '-')
-        log.info(f'{"Variable":<20}{"Low":<10}{"High":<20}')
-        log.info(40 * '-')
-        for var, d_frq in self._d_out_of_map.items():
-            val_low  = d_frq.get(False,0)
-            val_high = d_frq.get(True ,0)
-            log.info(f'{var:<20}{val_low:<10}{val_high:<20}')
-        log.info(40 * '-')
+        for name, arr_weight in d_weight.items():
+            self._df[f'weight_{name}'] = arr_weight
 
         return self._df
+    # ------------------------------
+    def get_toy_weights(self, ntoys : int, seed : int = 42) -> numpy.ndarray:
+        '''
+        Evaluates weights with replicas of the maps, where each cell is fluctuated
+        with a Gaussian according to its uncertainty. Meant to estimate the systematic
+        uncertainty associated to the statistics of the calibration samples.
+
+        Parameters
+        ----------------
+        ntoys: Number of replicas of the maps
+        seed : Seed for random number generator, used to make the replicas
+
+        Returns
+        ----------------
+        Array with shape (ntoys, ncandidates), with the input weights multiplied by the
+        transfer weights from each set of replicas
+        '''
+        if len(self._df) == 0:
+            log.warning('Empty dataframe, not making toys')
+            return numpy.zeros((ntoys, 0))
+
+        rng         = numpy.random.default_rng(seed)
+        self._d_toy = { key : self._d_map[key].get_toys(ntoys=ntoys, rng=rng) for key in sorted(self._d_map) }
+
+        log.info(f'Evaluating {ntoys} toys with {len(self._d_toy)} maps')
+
+        # Anomalies are the same as for the nominal maps, do not count them again
+        counter       = self._counter
+        self._counter = AnomalyCounter()
+        try:
+            arr_trf = self._get_transfer_weights()
+        finally:
+            self._d_toy   = {}
+            self._counter = counter
+
+        arr_trf = numpy.broadcast_to(arr_trf, (ntoys, len(self._df)))
+
+        return arr_trf * self._arr_wgt
+    # ------------------------------
+    def get_anomalies(self) -> pnd.DataFrame:
+        '''
+        Returns
+        ---------------
+        Dataframe with number of candidates outside maps, with efficiencies
+        from fixed cells of the maps or with zero efficiencies in the control region.
+        See AnomalyCounter
+        '''
+        return self._counter.to_df()
+    # ------------------------------
+    def get_weighted_data(self, vectorized : bool = True) -> pnd.DataFrame:
+        '''
+        Parameters
+        ----------------
+        vectorized: If True (default) the weights are calculated on whole columns at once.
+                    Otherwise the calculation is done candidate by candidate
+
+        Returns instance of weighted data. If the config has a `variants` section, e.g.:
+
+        variants:
+          v12:
+            path   : /path/to/maps/v12
+          tight:
+            regions:
+              control : ...
+              signal  : ...
+
+        there will be an extra `weight_{name}` column per variant, with the weights obtained
+        after overriding the config with the entries of that variant
+        '''
+        df = self._weight(vectorized=vectorized)
+
+        log.info(f'Processed {len(df)} entries')
+        self._counter.log_summary()
+
+        return df
+    # ------------------------------
+    @classmethod
+    def weight_parquet(
+            cls,
+            inp_path   : str,
+            out_path   : str,
+            is_sig     : bool,
+            sample     : str,
+            cfg        : dict,
+            batch_size : int  = 100_000,
+            anomalies  : bool = False,
+            columns    : list[str]|None = None,
+            kinds      : list[str]|None = None,
+            blocks     : list[int]|None = None) -> int:
+        '''
+        Streaming version of `get_weighted_data`, the input is read in chunks, which are weighted
+        and written to the output one at a time, such that the memory needed does not depend
+        on the size of the dataset.
+
+        Parameters
+        ----------------
+        inp_path  : Path to parquet file or to partitioned parquet dataset with candidates,
+                    e.g. cache written by SampleSplitter
+        out_path  : Path to parquet file where weighted candidates will be written, has to end in `.parquet`
+        is_sig    : See __init__
+        sample    : See __init__
+        cfg       : See __init__
+        batch_size: Maximum number of candidates weighted at once
+        anomalies : If True, will save the counts from `get_anomalies` next to the output,
+                    in a JSON file with the same name and `.json` extension
+        columns   : Columns to keep in the output, on top of the ones needed for weighting,
+                    see `get_columns`. If None (default) all the columns are read and kept
+        kinds     : If passed, only candidates of these kinds, e.g. PassFail, are read
+        blocks    : If passed, only candidates in these blocks are read
+
+        Returns
+        ----------------
+        Number of candidates written
+        '''
+        if not out_path.endswith('.parquet'):
+            raise ValueError(f'Output path does not have .parquet extension: {out_path}')
+
+        dataset  = ds.dataset(inp_path, format='parquet', partitioning='hive')
+        l_column = cls._get_read_columns(dataset=dataset, cfg=cfg, columns=columns)
+        expr     = cls._get_partition_filter(kinds=kinds, blocks=blocks)
+        log.info(f'Weighting entries in chunks of {batch_size} from: {inp_path}')
+
+        writer   = None
+        nentries = 0
+        counter  = AnomalyCounter()
+        try:
+            for batch in dataset.to_batches(columns=l_column, filter=expr, batch_size=batch_size):
+                if batch.num_rows == 0:
+                    continue
+
+                df  = batch.to_pandas()
+                obj = cls(df=df, is_sig=is_sig, sample=sample, cfg=cfg)
+                df  = obj._weight(vectorized=True)
+                tab = pa.Table.from_pandas(df, preserve_index=False)
+                counter.merge(obj._counter)
+
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, tab.schema)
+
+                writer.write_table(tab)
+                nentries += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if writer is None:
+            log.warning(f'No entries found in: {inp_path}')
+            # Weighted, such that the output has the same columns as the ones with entries
+            schema = dataset.schema if l_column is None else pa.schema([ dataset.schema.field(name) for name in l_column ])
+            obj    = cls(df=schema.empty_table().to_pandas(), is_sig=is_sig, sample=sample, cfg=cfg)
+            df     = obj._weight(vectorized=True)
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), out_path)
+
+        log.info(f'Written {nentries} weighted entries to: {out_path}')
+        counter.log_summary()
+
+        if anomalies:
+            counter.save(path=f'{os.path.splitext(out_path)[0]}.json')
+
+        return nentries
+    # ------------------------------
+    @classmethod
+    def _get_read_columns(
+            cls,
+            dataset : ds.Dataset,
+            cfg     : dict,
+            columns : list[str]|None) -> list[str]|None:
+        '''
+        Returns list of columns to read from dataset, None if all of them have to be read.
+        Columns starting with underscore, e.g. the row index written by SampleSplitter, are not read
+        '''
+        l_name = [ name for name in dataset.schema.names if not name.startswith('_') ]
+        if columns is None:
+            return None if len(l_name) == len(dataset.schema.names) else l_name
+
+        s_name   = cls.get_columns(cfg=cfg) | set(columns)
+        l_column = [ name for name in dataset.schema.names if name in s_name ]
+
+        return l_column
+    # ------------------------------
+    @staticmethod
+    def _get_partition_filter(
+            kinds  : list[str]|None,
+            blocks : list[int]|None) -> ds.Expression|None:
+        '''
+        Returns expression used to read only the needed partitions of the dataset, None if all are needed
+        '''
+        expr = None
+        if kinds is not None:
+            expr = ds.field('kind').isin(kinds)
+
+        if blocks is not None:
+            expr_block = ds.field('block').isin(blocks)
+            expr       = expr_block if expr is None else expr & expr_block
+
+        return expr
 # ------------------------------
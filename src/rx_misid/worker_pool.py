@@ -0,0 +1,163 @@
+'''
+Module with WorkerPool class
+'''
+import copy
+import atexit
+import importlib
+from types                       import NoneType
+from multiprocessing.pool        import Pool
+
+from dmu.logging.log_store       import LogStore
+from dmu.workflow.cache          import Cache as Wcache
+from rx_misid.map_repository     import MapRepository
+
+log=LogStore.add_logger('rx_misid:worker_pool')
+# ------------------------------
+class WorkerPool:
+    '''
+    Class meant to hold a pool of worker processes that lives until the end of the session, such that:
+
+    - The workers are started once, instead of once per call, keeping their imports
+    - The maps shared when the pool was made, and any map loaded later by the workers,
+    stay loaded between calls
+
+    The workers are copies of this process made when the pool is started. The pool is remade
+    if the settings the workers copied changed since then, see `track`
+    '''
+    _pool   : Pool|None      = None
+    _nproc  : int            = 0
+    _atexit : bool           = False
+    _s_path : set[str]       = set()    # Paths to maps shared with the workers
+    _state  : dict|None      = None     # Settings of this process when the pool was made
+    _l_class: list[type]     = [Wcache] # Classes whose settings are copied by the workers
+    # ------------------------------
+    @classmethod
+    def track(cls, obj : type) -> None:
+        '''
+        Parameters
+        -------------
+        obj: Class with settings stored as class attributes, e.g. set with context managers.
+             The pool is remade when they differ from the ones the workers copied
+        '''
+        if obj not in cls._l_class:
+            cls._l_class.append(obj)
+    # ------------------------------
+    @classmethod
+    def get_state(cls) -> dict:
+        '''
+        Returns
+        -------------
+        Dictionary with copy of the settings of the tracked classes, e.g. caching directory and classes
+        that do not use caching, and the logging levels. It can be pickled and passed to `set_state`
+        in other processes
+        '''
+        d_class = {}
+        for obj in cls._l_class:
+            d_class[f'{obj.__module__}:{obj.__qualname__}'] = {
+                    name : copy.deepcopy(val)
+                    for name, val in vars(obj).items()
+                    if not name.startswith('__') and isinstance(val, (NoneType, bool, int, float, str, list, tuple, dict, set)) }
+
+        d_state           = {'classes' : d_class}
+        d_state['levels'] = { name : logger.level for name, logger in LogStore.d_logger.items() }
+        d_state['stored'] = dict(LogStore.d_levels)
+
+        return d_state
+    # ------------------------------
+    @staticmethod
+    def set_state(state : dict) -> None:
+        '''
+        Parameters
+        -------------
+        state: Settings returned by `get_state`, usually in another process. They are copied
+               to the classes and loggers of this process, importing the classes if needed
+        '''
+        for key, d_attr in state['classes'].items():
+            module, qualname = key.split(':')
+            obj = importlib.import_module(module)
+            for name in qualname.split('.'):
+                obj = getattr(obj, name)
+
+            for name, val in d_attr.items():
+                setattr(obj, name, copy.deepcopy(val))
+
+        LogStore.d_levels.update(state['stored'])
+        for name, level in state['levels'].items():
+            LogStore.set_level(name, level)
+    # ------------------------------
+    @classmethod
+    def _can_reuse(cls, nproc : int, l_path : list[str], state : dict) -> bool:
+        '''
+        Returns true if the current pool can be used for a call to `get` with these arguments
+        and the current settings `state`
+        '''
+        if cls._pool is None:
+            return False
+
+        if cls._nproc < nproc:
+            log.debug(f'Pool has {cls._nproc} processes, {nproc} are needed')
+            return False
+
+        if not set(l_path) <= cls._s_path:
+            log.debug('Maps not shared with the pool are needed')
+            return False
+
+        if state != cls._state:
+            log.debug('Settings changed since the pool was made')
+            return False
+
+        return True
+    # ------------------------------
+    @classmethod
+    def get(cls, nproc : int, l_path : list[str]) -> Pool:
+        '''
+        Parameters
+        -------------
+        nproc : Minimum number of processes needed
+        l_path: List of paths to maps, shared with the workers when the pool is made
+
+        Returns
+        -------------
+        Pool of workers. The pool made by a previous call is returned if it has at least
+        `nproc` processes, it was made with all the maps in `l_path` and the settings of the
+        tracked classes did not change. Otherwise it is replaced with a new one, sharing these maps.
+        Maps not shared are loaded by the workers when needed and cached, see `MapRepository.get_map`
+        '''
+        state = cls.get_state()
+        if cls._can_reuse(nproc=nproc, l_path=l_path, state=state):
+            log.debug(f'Reusing pool with {cls._nproc} processes')
+            return cls._pool
+
+        cls.shutdown()
+
+        log.info(f'Starting pool with {nproc} processes')
+        manifest   = MapRepository.share(l_path)
+        cls._pool  = Pool(processes=nproc, initializer=MapRepository.attach, initargs=(manifest,))
+        cls._nproc = nproc
+        cls._s_path= set(l_path)
+        cls._state = state
+
+        if not cls._atexit:
+            atexit.register(cls.shutdown)
+            cls._atexit = True
+
+        return cls._pool
+    # ------------------------------
+    @classmethod
+    def shutdown(cls) -> None:
+        '''
+        Stops the workers, if any, and releases the maps shared with them
+        '''
+        if cls._pool is None:
+            return
+
+        log.debug(f'Stopping pool with {cls._nproc} processes')
+        cls._pool.close()
+        cls._pool.join()
+        MapRepository.release()
+
+        cls._pool  = None
+        cls._nproc = 0
+        cls._s_path= set()
+        cls._state = None
+# ------------------------------
@@ -37,6 +37,14 @@ def _load_conf() -> None:
     with open(conf_path, encoding='utf-8') as ifile:
         Data.cfg = yaml.safe_load(ifile)
 # ---------------------------------------
+def _get_columns() -> list[str]:
+    '''
+    Returns list of columns needed to make the plots, the rest are not read
+    '''
+    l_col = list(Data.cfg['plots']) + ['weight', 'kind', 'hadron', 'bmeson']
+
+    return list(dict.fromkeys(l_col))
+# ---------------------------------------
 def _rdf_from_df(df : pnd.DataFrame) -> dict[str,RDataFrame]:
     df      = df.drop(columns=['kind', 'hadron', 'bmeson'])
     rdf_wgt = RDF.FromPandas(df)
@@ -74,7 +82,7 @@ def main():
     '''
     _parse_args()
     _load_conf()
-    df_all= pnd.read_parquet(Data.file_path)
+    df_all= pnd.read_parquet(Data.file_path, columns=_get_columns())
 
     _plot_kind(df_all, kind='Combined')
 
@@ -3,9 +3,14 @@ Module storing data classes needed by tests
 Also pytest functions intended to be run after tests
 '''
 import os
+import pickle
+from collections.abc import Callable
 
+import numpy
+import pytest
 import mplhep
 import pandas            as pnd
+import boost_histogram   as bh
 import matplotlib.pyplot as plt
 
 from dmu.logging.log_store import LogStore
@@ -37,6 +42,33 @@ class DataCollector:
         df=DataCollector.d_df[name]
         df.loc[len(df)] = data
 # -----------------------------------
+def _make_map(out_dir : str, name : str, value : float) -> str:
+    '''
+    Writes 3x2 efficiency map with `value` in every bin to `out_dir/name.pkl` and returns the path
+    '''
+    hist = bh.Histogram(
+            bh.axis.Regular(3, 2.7, 4.5),
+            bh.axis.Regular(2, 1.5, 5.0),
+            storage=bh.storage.Weight())
+
+    view          = hist.view()
+    view.value    = numpy.full((3, 2), value)
+    view.variance = numpy.full((3, 2), 0.01)
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = f'{out_dir}/{name}.pkl'
+    with open(path, 'wb') as ofile:
+        pickle.dump(hist, ofile)
+
+    return path
+# -----------------------------------
+@pytest.fixture
+def make_map() -> Callable[[str,str,float],str]:
+    '''
+    Provides function making toy efficiency maps, used by tests of MapRepository and WorkerPool
+    '''
+    return _make_map
+# -----------------------------------
 def _plot_scales(df : pnd.DataFrame, name : str, kind : str) -> None:
     ax = None
     for sample, df_sample in df.groupby('sample'):
@@ -0,0 +1,52 @@
+'''
+Module with functions meant to test AnomalyCounter class
+'''
+import os
+
+import numpy
+import pandas as pnd
+import pytest
+
+from dmu.logging.log_store    import LogStore
+from rx_misid.anomaly_counter import AnomalyCounter
+
+log=LogStore.add_logger('rx_misid:test_anomaly_counter')
+# -------------------------------------------------------
+class Data:
+    '''
+    Data class
+    '''
+    out_dir = '/tmp/tests/rx_misid/anomaly_counter'
+# -------------------------------------------------------
+@pytest.fixture(scope='session', autouse=True)
+def _initialize():
+    LogStore.set_level('rx_misid:anomaly_counter', 10)
+    os.makedirs(Data.out_dir, exist_ok=True)
+# -------------------------------------------------------
+def test_simple():
+    '''
+    Tests counting, merging and saving
+    '''
+    ctr_1 = AnomalyCounter()
+    ctr_1.add(block=1, hadron='kaon', region='signal', variable='L1_TRACK_ETA', category='below_map', count=3)
+    ctr_1.add(block=1, hadron='kaon', region='signal', variable='L1_TRACK_ETA', category='below_map', count=0)
+    ctr_1.add_flags(block=2, hadron='pion', region='control', variable='L2', arr_flag=numpy.array([0, 1, 1, 3, 0]))
+
+    ctr_2 = AnomalyCounter()
+    ctr_2.add(block=1, hadron='kaon', region='signal', variable='L1_TRACK_ETA', category='below_map', count=2)
+
+    ctr_1.merge(ctr_2)
+    ctr_1.log_summary()
+
+    df = ctr_1.to_df()
+    d_count = { row.category : row['count'] for _, row in df.iterrows() }
+
+    assert len(df) == 3
+    assert d_count == {'below_map' : 5, 'nan' : 2, 'above_one' : 1}
+
+    path = f'{Data.out_dir}/anomalies.json'
+    ctr_1.save(path=path)
+    df_read = pnd.read_json(path, orient='records')
+
+    assert df_read['count'].sum() == 8
+# -------------------------------------------------------
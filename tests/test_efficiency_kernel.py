@@ -0,0 +1,46 @@
+'''
+Module with functions meant to test the efficiency_kernel module
+'''
+import numpy
+import pytest
+
+from dmu.logging.log_store import LogStore
+from rx_misid              import efficiency_kernel as ekr
+
+log=LogStore.add_logger('rx_misid:test_efficiency_kernel')
+# -------------------------------------------------------
+def _get_inputs(nentries : int) -> tuple:
+    rng        = numpy.random.default_rng(seed=1)
+    sig_values = rng.uniform(0, 1, size=(6, 7))
+    ctr_values = rng.uniform(0, 1, size=(6, 7))
+
+    sig_index  = tuple(rng.integers(0, size, size=nentries) for size in [6, 7, 6, 7])
+    ctr_index  = tuple(rng.integers(0, size, size=nentries) for size in [6, 7, 6, 7])
+
+    return sig_values, ctr_values, sig_index, ctr_index
+# -------------------------------------------------------
+@pytest.mark.parametrize('use_numba', [True, False])
+def test_region_efficiencies(use_numba : bool):
+    '''
+    Compares kernel with per-candidate calculation
+    '''
+    sig_values, ctr_values, sig_index, ctr_index = _get_inputs(nentries=1_000)
+
+    eff_sig, eff_ctr = ekr.get_region_efficiencies(
+            sig_values = sig_values,
+            ctr_values = ctr_values,
+            sig_index  = sig_index,
+            ctr_index  = ctr_index,
+            use_numba  = use_numba)
+
+    six1, siy1, six2, siy2 = sig_index
+    cix1, ciy1, cix2, ciy2 = ctr_index
+    for i in range(1_000):
+        eff_p1 = sig_values[six1[i], siy1[i]]
+        eff_p2 = sig_values[six2[i], siy2[i]]
+        eff_f1 = ctr_values[cix1[i], ciy1[i]]
+        eff_f2 = ctr_values[cix2[i], ciy2[i]]
+
+        assert eff_sig[i] == pytest.approx(eff_p1 * eff_p2)
+        assert eff_ctr[i] == pytest.approx(eff_p1 * eff_f2 + eff_p2 * eff_f1 + eff_f1 * eff_f2)
+# -------------------------------------------------------
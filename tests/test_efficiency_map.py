@@ -0,0 +1,55 @@
+'''
+Module with functions meant to test EfficiencyMap class
+'''
+import numpy
+import boost_histogram as bh
+
+from dmu.logging.log_store   import LogStore
+from rx_misid.efficiency_map import EfficiencyMap
+
+log=LogStore.add_logger('rx_misid:test_efficiency_map')
+# -------------------------------------------------------
+def _get_hist() -> bh.Histogram:
+    hist = bh.Histogram(
+            bh.axis.Variable([2.7, 3.0, 3.5, 4.5]),
+            bh.axis.Regular(2, 1.5, 5.0),
+            storage=bh.storage.Weight())
+
+    view          = hist.view()
+    view.value    = [[0.5, numpy.nan], [-0.1, 1.2], [0.0, 1.0]]
+    view.variance = [[0.1,      0.1 ], [ 0.1, 0.1], [0.1, 0.1]]
+
+    return hist
+# -------------------------------------------------------
+def test_from_hist():
+    '''
+    Tests sanitation of efficiencies and bookkeeping of fixed cells
+    '''
+    hist = _get_hist()
+    emap = EfficiencyMap.from_hist(hist=hist, name='test')
+
+    assert emap.values.flags['C_CONTIGUOUS']
+    assert numpy.array_equal(emap.values, [[0.5, 0.0], [0.0, 1.0], [0.0, 1.0]])
+    assert numpy.allclose(emap.variances, 0.1)
+    assert numpy.array_equal(emap.edges(0), [2.7, 3.0, 3.5, 4.5])
+    assert numpy.array_equal(emap.edges(1), [1.5, 3.25, 5.0])
+    assert emap.fixed == {'nan' : 1, 'negative' : 1, 'above_one' : 1}
+# -------------------------------------------------------
+def test_toys():
+    '''
+    Tests replicas of map fluctuated within uncertainties
+    '''
+    hist = _get_hist()
+    emap = EfficiencyMap.from_hist(hist=hist, name='test')
+
+    rng     = numpy.random.default_rng(seed=1)
+    arr_toy = emap.get_toys(ntoys=1000, rng=rng)
+
+    assert arr_toy.shape == (1000, 3, 2)
+    assert numpy.all((arr_toy >= 0) & (arr_toy <= 1))
+    assert not numpy.allclose(arr_toy[0], arr_toy[1])
+    assert abs(arr_toy[:, 0, 0].mean() - 0.5) < 0.05
+
+    arr_fix = emap.flags != 0
+    assert numpy.all(arr_toy[:, arr_fix] == emap.values[arr_fix])
+# -------------------------------------------------------
@@ -0,0 +1,100 @@
+'''
+Module with functions meant to test the executors
+'''
+import os
+import math
+import operator
+
+import pytest
+
+from dmu.logging.log_store import LogStore
+from dmu.workflow.cache    import Cache as Wcache
+from rx_misid              import executor as exe
+from rx_misid.worker_pool  import WorkerPool
+
+log=LogStore.add_logger('rx_misid:test_executor')
+# -------------------------------------------------------
+class Data:
+    '''
+    Data class
+    '''
+    l_arg   = [5, 3, 0, 7, 1, 10]
+# -------------------------------------------------------
+@pytest.fixture(scope='session', autouse=True)
+def _initialize():
+    LogStore.set_level('rx_misid:executor', 10)
+
+    yield
+
+    WorkerPool.shutdown()
+# -------------------------------------------------------
+def _get_executor(name : str) -> exe.Executor:
+    if name == 'serial':
+        return exe.SerialExecutor()
+
+    if name == 'process':
+        return exe.ProcessExecutor(nproc=2)
+
+    if name == 'thread':
+        return exe.ThreadExecutor(nthreads=2)
+
+    if name == 'joblib':
+        pytest.importorskip('joblib')
+        return exe.JoblibExecutor(nproc=2)
+
+    if name == 'subprocess':
+        return exe.SubprocessExecutor(nproc=2, work_dir='/tmp')
+
+    raise ValueError(f'Invalid executor: {name}')
+# -------------------------------------------------------
+@pytest.mark.parametrize('name', ['serial', 'process', 'thread', 'joblib', 'subprocess'])
+def test_map(name : str):
+    '''
+    Tests that results are returned in the order of the arguments
+    '''
+    obj = _get_executor(name=name)
+    obj.share_maps([])
+
+    l_res = obj.map(math.factorial, Data.l_arg)
+
+    assert l_res == [ math.factorial(arg) for arg in Data.l_arg ]
+# -------------------------------------------------------
+@pytest.mark.parametrize('name', ['serial', 'process', 'thread', 'joblib', 'subprocess'])
+def test_imap_unordered(name : str):
+    '''
+    Tests that all the results are returned, in any order
+    '''
+    obj   = _get_executor(name=name)
+    l_res = list(obj.imap_unordered(math.factorial, Data.l_arg))
+
+    assert sorted(l_res) == sorted(math.factorial(arg) for arg in Data.l_arg)
+# -------------------------------------------------------
+def test_batch_failure():
+    '''
+    Tests that a failing batch task raises with the error of the task
+    '''
+    obj = exe.SubprocessExecutor(nproc=2)
+
+    with pytest.raises(RuntimeError, match='factorial'):
+        obj.map(math.factorial, [3, -1])
+# -------------------------------------------------------
+def test_batch_abnormal_exit():
+    '''
+    Tests that a job exiting before writing its result raises with the task and exit code
+    '''
+    obj = exe.SubprocessExecutor(nproc=2)
+
+    with pytest.raises(RuntimeError, match='code 3'):
+        obj.map(os._exit, [3]) # pylint: disable=protected-access
+# -------------------------------------------------------
+def test_batch_state():
+    '''
+    Tests that the jobs run with the settings of this process
+    '''
+    obj      = exe.SubprocessExecutor(nproc=2)
+    get_skip = operator.attrgetter('_l_skip_class')
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        l_skip = obj.map(get_skip, [Wcache, Wcache])
+
+    assert l_skip == [['MisIDCalculator'], ['MisIDCalculator']]
+# -------------------------------------------------------
@@ -0,0 +1,113 @@
+'''
+Module with functions meant to test MapRepository class
+'''
+import os
+import multiprocessing
+
+import numpy
+import pytest
+
+from dmu.logging.log_store   import LogStore
+from rx_misid.map_repository import MapRepository
+
+log=LogStore.add_logger('rx_misid:test_map_repository')
+# -------------------------------------------------------
+class Data:
+    '''
+    Data class
+    '''
+    out_dir = '/tmp/tests/rx_misid/map_repository'
+# -------------------------------------------------------
+@pytest.fixture(scope='session', autouse=True)
+def _initialize():
+    LogStore.set_level('rx_misid:map_repository', 10)
+    os.makedirs(Data.out_dir, exist_ok=True)
+# -------------------------------------------------------
+def _get_sum(path : str) -> float:
+    emap = MapRepository.get_map(path=path)
+
+    return float(emap.values.sum())
+# -------------------------------------------------------
+def _is_shared(path : str) -> bool:
+    emap = MapRepository.get_map(path=path)
+
+    # Maps attached to shared memory are read only
+    return not emap.values.flags.writeable
+# -------------------------------------------------------
+def _attach(manifest : list[dict]) -> None:
+    # Forked workers copy the maps already loaded by the parent
+    MapRepository.clear()
+    MapRepository.attach(manifest)
+# -------------------------------------------------------
+def test_cache(make_map):
+    '''
+    Tests that maps are loaded once and reloaded when the file changes
+    '''
+    path = make_map(Data.out_dir, name='cache', value=0.5)
+
+    emap_1 = MapRepository.get_map(path=path)
+    emap_2 = MapRepository.get_map(path=path)
+
+    assert emap_1 is emap_2
+
+    path   = make_map(Data.out_dir, name='cache', value=0.2)
+    stat   = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    emap_3 = MapRepository.get_map(path=path)
+    l_key  = [ key for key in MapRepository._d_map if key[0] == os.path.abspath(path) ] # pylint: disable=protected-access
+
+    assert emap_3 is not emap_1
+    assert numpy.allclose(emap_3.values, 0.2)
+    assert len(l_key) == 1
+# -------------------------------------------------------
+def test_clear(make_map):
+    '''
+    Tests that maps are loaded again after clearing the repository
+    '''
+    path   = make_map(Data.out_dir, name='clear', value=0.5)
+
+    emap_1 = MapRepository.get_map(path=path)
+    MapRepository.clear()
+    emap_2 = MapRepository.get_map(path=path)
+
+    assert emap_1 is not emap_2
+# -------------------------------------------------------
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+def test_shared(method : str, make_map):
+    '''
+    Tests that workers can attach to maps in shared memory
+    '''
+    l_path = [ make_map(Data.out_dir, name=f'shared_{index}', value=0.1 * index) for index in range(3) ]
+    l_sum  = [ _get_sum(path) for path in l_path ]
+
+    ctx    = multiprocessing.get_context(method)
+    with MapRepository.shared(l_path) as manifest,\
+         ctx.Pool(processes=2, initializer=_attach, initargs=(manifest,)) as pool:
+        l_sum_shared = pool.map(_get_sum  , l_path)
+        l_is_shared  = pool.map(_is_shared, l_path)
+
+    assert numpy.allclose(l_sum, l_sum_shared)
+    assert all(l_is_shared)
+# -------------------------------------------------------
+def test_checksum(make_map):
+    '''
+    Tests that the checksum changes only when the content or name of the maps change
+    '''
+    l_path = [ make_map(Data.out_dir, name=f'checksum_{index}', value=0.1 * index) for index in range(2) ]
+
+    val_1  = MapRepository.get_checksum(l_path)
+    val_2  = MapRepository.get_checksum(l_path)
+    val_3  = MapRepository.get_checksum(l_path[:1])
+
+    assert val_1 == val_2
+    assert val_1 != val_3
+
+    path   = make_map(Data.out_dir, name='checksum_1', value=0.7)
+    stat   = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    val_4  = MapRepository.get_checksum(l_path)
+
+    assert val_4 != val_1
+# -------------------------------------------------------
@@ -4,6 +4,7 @@ File with functions to test MCScaler
 import pytest
 
 from dmu.logging.log_store  import LogStore
+from dmu.generic            import utilities as gut
 from conftest               import DataCollector
 from rx_misid.mc_scaler     import MCScaler
 from rx_misid.misid_pdf     import MisIdPdf
@@ -46,3 +47,23 @@ def test_simple(q2bin : str, sample : str):
 
     DataCollector.add_entry(name='simple', data=d_row)
 # -----------------------------------------------
+@pytest.mark.parametrize('sample', ['Bu_JpsiK_ee_eq_DPC'])
+def test_cutflow(sample : str):
+    '''
+    Checks that the cutflow and timing are saved next to the cached scales
+    '''
+    sig_reg = MisIdPdf.get_signal_cut()
+
+    scl = MCScaler(
+            q2bin  ='central',
+            sample =sample,
+            sig_reg=sig_reg)
+
+    nsig_mc, nctr_mc, _ = scl.get_scale()
+
+    data = gut.load_json(f'{scl._out_path}/cutflow.json')
+
+    assert data['time'] >= 0
+    assert data['cutflow']['signal' ][-1]['Passed'] == nsig_mc
+    assert data['cutflow']['control'][-1]['Passed'] == nctr_mc
+# -----------------------------------------------
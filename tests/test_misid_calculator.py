@@ -9,7 +9,10 @@ import pytest
 import pandas            as pnd
 import matplotlib.pyplot as plt
 from dmu.logging.log_store     import LogStore
+from dmu.workflow.cache        import Cache as Wcache
 from rx_misid.misid_calculator import MisIDCalculator
+from rx_misid.worker_pool      import WorkerPool
+from rx_misid                  import executor as exe
 
 log=LogStore.add_logger('rx_misid:test_misid_calculator')
 # -------------------------------------------------------
@@ -99,3 +102,200 @@ def test_misid(sample : str, mode : str, q2bin : str):
 
     _validate_df(df=df, sample=sample, mode=mode, q2bin=q2bin)
 # ---------------------------------
+@pytest.mark.parametrize('mode'  , ['signal', 'control'])
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c3', 'Bu_JpsiK_ee_eq_DPC'])
+def test_one_pass(sample : str, mode : str):
+    '''
+    Checks that reading the sample once gives the same output as reading it once per charge and hadron
+    '''
+    cfg                    = _get_config()
+    cfg['input']['sample'] = sample
+    cfg['input']['q2bin' ] = 'central'
+
+    if   sample.startswith('DATA'):
+        cfg['input']['project'] = 'rx'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_ext'
+    else:
+        cfg['input']['project'] = 'nopid'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+
+    is_sig = {'signal' : True, 'control' : False}[mode]
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=is_sig)
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        df_one = obj.get_misid(one_pass=True)
+        df_all = obj.get_misid(multi_proc=False)
+
+    pnd.testing.assert_frame_equal(df_one, df_all)
+# ---------------------------------
+@pytest.mark.parametrize('nthreads', [1, 8])
+def test_multithreading(nthreads : int):
+    '''
+    Checks that running with implicit multithreading gives the same candidates as running in one pass
+    '''
+    cfg                     = _get_config()
+    cfg['input']['sample' ] = 'DATA_24_MagUp_24c3'
+    cfg['input']['q2bin'  ] = 'central'
+    cfg['input']['project'] = 'rx'
+    cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_ext'
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        df_mth = obj.get_misid(nthreads=nthreads)
+        df_one = obj.get_misid(one_pass=True)
+
+    l_col  = ['bmeson', 'hadron', 'kind', 'B_M_brem_track_2']
+    df_mth = df_mth.sort_values(l_col).reset_index(drop=True)
+    df_one = df_one.sort_values(l_col).reset_index(drop=True)
+
+    pnd.testing.assert_frame_equal(df_mth, df_one)
+# ---------------------------------
+@pytest.mark.parametrize('one_pass', [True, False])
+def test_per_file(one_pass : bool):
+    '''
+    Checks that splitting and caching per file gives the same candidates as processing the whole sample
+    '''
+    cfg                     = _get_config()
+    cfg['input']['sample' ] = 'DATA_24_MagUp_24c3'
+    cfg['input']['q2bin'  ] = 'central'
+    cfg['input']['project'] = 'rx'
+    cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_ext'
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    df_all = obj.get_misid(multi_proc=False, one_pass=one_pass)
+
+    cfg['input']['per_file'] = True
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    df_fil = obj.get_misid(multi_proc=False, one_pass=one_pass)
+
+    l_col  = ['bmeson', 'hadron', 'kind', 'block', 'B_M_brem_track_2']
+    df_all = df_all.sort_values(l_col).reset_index(drop=True)
+    df_fil = df_fil.sort_values(l_col).reset_index(drop=True)
+
+    pnd.testing.assert_frame_equal(df_all, df_fil, check_like=True)
+# ---------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c3', 'Bu_JpsiK_ee_eq_DPC'])
+def test_shards(sample : str):
+    '''
+    Checks that processing the sample in shards gives the same output as processing it at once
+    '''
+    cfg                    = _get_config()
+    cfg['input']['sample'] = sample
+    cfg['input']['q2bin' ] = 'central'
+
+    if   sample.startswith('DATA'):
+        cfg['input']['project'] = 'rx'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_ext'
+    else:
+        cfg['input']['project'] = 'nopid'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    df_all = obj.get_misid(multi_proc=False)
+
+    cfg['input']['shards'] = 5
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    df_shr = obj.get_misid()
+
+    pnd.testing.assert_frame_equal(
+            df_all.reset_index(drop=True),
+            df_shr.reset_index(drop=True))
+# ---------------------------------
+def test_pool():
+    '''
+    Checks that the pool of workers is reused across calls and q2 bins
+    '''
+    cfg                     = _get_config()
+    cfg['input']['sample' ] = 'Bu_JpsiK_ee_eq_DPC'
+    cfg['input']['project'] = 'nopid'
+    cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+
+    d_df = {}
+    for q2bin in ['central', 'high']:
+        cfg['input']['q2bin'] = q2bin
+        obj         = MisIDCalculator(cfg=cfg, is_sig=True)
+        d_df[q2bin] = obj.get_misid(multi_proc=True)
+        pool        = WorkerPool.get(nproc=4, l_path=[])
+
+        if q2bin == 'central':
+            pool_central = pool
+
+        with Wcache.turn_off_cache(val=['MisIDCalculator']):
+            df_ser = obj.get_misid(multi_proc=False)
+        pnd.testing.assert_frame_equal(d_df[q2bin], df_ser)
+
+    assert pool is pool_central
+# ---------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c3', 'Bu_JpsiK_ee_eq_DPC'])
+def test_q2bins(sample : str):
+    '''
+    Checks that processing all the q2 bins at once gives the same output as processing them one by one
+    '''
+    l_q2bin                = ['low', 'central', 'high']
+    cfg                    = _get_config()
+    cfg['input']['sample'] = sample
+
+    if   sample.startswith('DATA'):
+        cfg['input']['project'] = 'rx'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_ext'
+    else:
+        cfg['input']['project'] = 'nopid'
+        cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+
+    cfg['input']['q2bin'] = l_q2bin
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    d_df   = obj.get_misid_q2bins(multi_proc=False)
+
+    assert list(d_df) == l_q2bin
+
+    for q2bin in l_q2bin:
+        cfg['input']['q2bin'] = q2bin
+        obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+        df_bin = obj.get_misid(multi_proc=False)
+
+        pnd.testing.assert_frame_equal(
+                d_df[q2bin].reset_index(drop=True),
+                df_bin.reset_index(drop=True))
+# ---------------------------------
+def test_cache():
+    '''
+    Checks that the weighted dataframe is read from the cache when the inputs do not change
+    '''
+    cfg                     = _get_config()
+    cfg['input']['sample' ] = 'Bu_JpsiK_ee_eq_DPC'
+    cfg['input']['project'] = 'nopid'
+    cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+    cfg['input']['q2bin'  ] = 'central'
+
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+        df_new = obj.get_misid()
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    df_chd = obj.get_misid()
+
+    assert os.path.islink(f'{obj._out_path}/misid.parquet')
+    pnd.testing.assert_frame_equal(df_new, df_chd)
+# ---------------------------------
+@pytest.mark.parametrize('name', ['process', 'subprocess'])
+def test_executor(name : str):
+    '''
+    Checks that the samples processed with each executor are the same as the ones processed serially
+    '''
+    cfg                     = _get_config()
+    cfg['input']['sample' ] = 'Bu_JpsiK_ee_eq_DPC'
+    cfg['input']['project'] = 'nopid'
+    cfg['input']['trigger'] = 'Hlt2RD_BuToKpEE_MVA_noPID'
+    cfg['input']['q2bin'  ] = 'central'
+
+    d_executor = {
+            'process'    : exe.ProcessExecutor(nproc=4),
+            'subprocess' : exe.SubprocessExecutor(nproc=4)}
+
+    obj    = MisIDCalculator(cfg=cfg, is_sig=True)
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        df_exe = obj.get_misid(executor=d_executor[name])
+        df_ser = obj.get_misid(executor=exe.SerialExecutor())
+
+    pnd.testing.assert_frame_equal(df_exe, df_ser)
+# ---------------------------------
@@ -7,8 +7,10 @@ import pytest
 import pandas            as pnd
 import matplotlib.pyplot as plt
 
-from dmu.logging.log_store  import LogStore
-from rx_misid.misid_dataset import MisIDDataset
+from dmu.logging.log_store     import LogStore
+from dmu.workflow.cache        import Cache as Wcache
+from rx_misid.misid_dataset    import MisIDDataset
+from rx_misid.misid_calculator import MisIDCalculator
 
 log = LogStore.add_logger('rx_misid:test_misid_dataset')
 # -----------------------------------------------
@@ -119,3 +121,72 @@ def test_only_data(q2bin : str):
             q2bin=q2bin,
             name ='no_leakage')
 # -----------------------------------------------
+@pytest.mark.parametrize('q2bin', ['central'])
+def test_scheduler(q2bin : str):
+    '''
+    Tests that processing all the tasks in a pool gives the same
+    datasets as processing them one by one
+    '''
+    dst     = MisIDDataset(q2bin=q2bin)
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        d_df_pl = dst.get_data(only_data=False, nproc=4)
+        d_df_sr = dst.get_data(only_data=False, nproc=1)
+
+    assert list(d_df_pl) == ['signal', 'leakage', 'data']
+
+    for component, df_sr in d_df_sr.items():
+        pnd.testing.assert_frame_equal(d_df_pl[component], df_sr)
+# -----------------------------------------------
+def test_q2bins():
+    '''
+    Tests that all q2 bins can be made in one pass over the samples
+    '''
+    l_q2bin = ['low', 'central', 'high']
+    dst     = MisIDDataset(q2bin=l_q2bin)
+    d_d_df  = dst.get_data_q2bins(only_data=True)
+
+    assert list(d_d_df) == l_q2bin
+
+    for q2bin, d_df in d_d_df.items():
+        assert list(d_df) == ['data']
+
+        _plot_data(
+                d_df =d_df,
+                q2bin=q2bin,
+                name ='q2bins')
+# -----------------------------------------------
+def test_shards():
+    '''
+    Tests that splitting the tasks in shards gives the same datasets as processing them at once
+    '''
+    dst     = MisIDDataset(q2bin='central')
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        d_df_sh = dst.get_data(only_data=True, nshard=3)
+        d_df_al = dst.get_data(only_data=True, nshard=1)
+
+    for component, df_al in d_df_al.items():
+        pnd.testing.assert_frame_equal(
+                d_df_sh[component].reset_index(drop=True),
+                df_al.reset_index(drop=True))
+# -----------------------------------------------
+def test_cache():
+    '''
+    Tests that the datasets are cached as the samples processed with MisIDCalculator
+    '''
+    dst     = MisIDDataset(q2bin='central')
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        d_df_nw = dst.get_data(only_data=True)
+
+    d_df_ch = dst.get_data(only_data=True)
+    pnd.testing.assert_frame_equal(d_df_nw['data'], d_df_ch['data'])
+
+    l_df    = []
+    for sample in dst._cfg['splitting']['samples']['data']: # pylint: disable=protected-access
+        cfg = dst._get_sample_config(sample=sample)         # pylint: disable=protected-access
+        obj = MisIDCalculator(cfg=cfg, is_sig=True)
+        l_df.append(obj.get_misid())
+
+        assert os.path.islink(f'{obj._out_path}/misid.parquet')
+
+    pnd.testing.assert_frame_equal(d_df_ch['data'], pnd.concat(l_df))
+# -----------------------------------------------
@@ -2,6 +2,7 @@
 Module with functions meant to test SampleSplitter class
 '''
 import os
+import json
 from importlib.resources import files
 
 import yaml
@@ -10,6 +11,7 @@ import mplhep
 import matplotlib.pyplot as plt
 import pandas as pnd
 from dmu.logging.log_store    import LogStore
+from dmu.workflow.cache       import Cache as Wcache
 from rx_data.rdf_getter       import RDFGetter
 from rx_misid.sample_splitter import SampleSplitter
 
@@ -177,3 +179,204 @@ def test_mc_true_e(
     _check_stats(df=df)
     _plot_pide(df=df, hadron_id=hadron_id, is_bplus=is_bplus, sample=sample)
 # -------------------------------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_JpsiK_ee_eq_DPC'])
+def test_partitions(sample : str):
+    '''
+    Tests splitting for both charges and hadrons in one pass
+    '''
+    log.info('')
+
+    if sample.startswith('DATA_'):
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext'  , project='rx')
+    else:
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_noPID', project='nopid')
+
+    cfg   = _get_config()
+    d_df  = SampleSplitter.get_partitions(rdf=rdf, sample=sample, cfg=cfg)
+
+    assert list(d_df) == [ (is_bplus, hadron_id) for is_bplus in [True, False] for hadron_id in Data.l_hadron_id ]
+
+    for (is_bplus, hadron_id), df in d_df.items():
+        log.info(f'Checking: {is_bplus}/{hadron_id}')
+        _check_stats(df=df)
+
+    path = f'{Wcache._cache_root}/sample_splitter_{sample}_kaon_True/cutflow.json' # pylint: disable=protected-access
+    with open(path, encoding='utf-8') as ifile:
+        data = json.load(ifile)
+
+    assert data['shared'] in [1, len(d_df)]
+# -------------------------------------------------------
+@pytest.mark.parametrize('hadron_id', Data.l_hadron_id)
+def test_dataset(hadron_id : str):
+    '''
+    Tests that the samples are cached as a dataset partitioned by kind and block
+    '''
+    sample= 'DATA_24_MagUp_24c2'
+    rdf   = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext', project='rx')
+    cfg   = _get_config()
+    spl   = SampleSplitter(
+            rdf      = rdf,
+            sample   = sample,
+            hadron_id= hadron_id,
+            is_bplus = True,
+            cfg      = cfg)
+
+    path  = spl.get_path()
+    df    = pnd.read_parquet(path, filters=[('kind', '==', 'FailFail')], columns=['block', 'weight'])
+
+    assert os.path.isdir(f'{path}/kind=FailFail')
+    assert len(df) > 0
+    assert df.columns.tolist() == ['block', 'weight']
+# -------------------------------------------------------
+def test_branches():
+    '''
+    Tests that only the branches needed downstream are read and that the savings are reported
+    '''
+    sample= 'DATA_24_MagUp_24c2'
+    rdf   = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext', project='rx')
+    cfg   = _get_config()
+    spl   = SampleSplitter(
+            rdf      = rdf,
+            sample   = sample,
+            hadron_id= 'kaon',
+            is_bplus = False,
+            cfg      = cfg)
+
+    df    = spl.get_samples()
+    path  = spl.get_path()
+    path  = os.path.dirname(path)
+
+    with open(f'{path}/branches.json', encoding='utf-8') as ifile:
+        data = json.load(ifile)
+
+    l_branch = data['branches']
+    log.info(f'Branches: {l_branch}')
+
+    assert set(df.columns) == set(l_branch) | {'kind', 'hadron'}
+    assert 'B_M_brem_track_2' in l_branch
+    assert 'L1_TRACK_PT'      in l_branch
+    assert data['saved'] > 0
+# -------------------------------------------------------
+def test_cutflow():
+    '''
+    Tests that the cutflow of each kind and the time of the event loop are saved with the samples
+    '''
+    sample= 'DATA_24_MagUp_24c2'
+    rdf   = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext', project='rx')
+    cfg   = _get_config()
+    spl   = SampleSplitter(
+            rdf      = rdf,
+            sample   = sample,
+            hadron_id= 'pion',
+            is_bplus = False,
+            cfg      = cfg)
+
+    df    = spl.get_samples()
+    path  = os.path.dirname(spl.get_path())
+
+    with open(f'{path}/cutflow.json', encoding='utf-8') as ifile:
+        data = json.load(ifile)
+
+    assert data['nruns' ] == 1
+    assert data['time'  ] >= 0
+    assert data['shared'] == 1
+    for kind, df_kind in df.groupby('kind'):
+        l_cut = data['cutflow'][kind]
+        assert l_cut[-1]['Passed'] == len(df_kind)
+# -------------------------------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_Kee_eq_btosllball05_DPC'])
+def test_streaming(sample : str):
+    '''
+    Tests that streaming the samples to disk in chunks gives the same samples
+    as keeping them in memory
+    '''
+    if sample.startswith('DATA_'):
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext'  , project='rx')
+    else:
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_noPID', project='nopid')
+
+    cfg_mem = _get_config()
+    cfg_str = _get_config()
+    cfg_str['max_memory'] = 1
+
+    d_df = {}
+    for name, cfg in [('memory', cfg_mem), ('streamed', cfg_str)]:
+        spl = SampleSplitter(
+                rdf      = rdf,
+                sample   = sample,
+                hadron_id= 'kaon',
+                is_bplus = True,
+                cfg      = cfg,
+                name     = name)
+
+        df         = spl.get_samples()
+        l_col      = sorted(df.columns)
+        d_df[name] = df[l_col].sort_values(by=l_col, ignore_index=True)
+
+    _check_stats(df=d_df['streamed'])
+    pnd.testing.assert_frame_equal(d_df['memory'], d_df['streamed'])
+# -------------------------------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_Kee_eq_btosllball05_DPC'])
+@pytest.mark.parametrize('max_memory', [None, 1])
+def test_cache(sample : str, max_memory : int|None):
+    '''
+    Tests that samples read from the cache are the same as the ones made, including
+    the order of the rows and columns and the column types
+    '''
+    if sample.startswith('DATA_'):
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext'  , project='rx')
+    else:
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_noPID', project='nopid')
+
+    cfg = _get_config()
+    cfg['max_memory'] = max_memory
+
+    l_df = []
+    for _ in range(2):
+        spl = SampleSplitter(
+                rdf      = rdf,
+                sample   = sample,
+                hadron_id= 'pion',
+                is_bplus = False,
+                cfg      = cfg,
+                name     = f'cache_{max_memory}')
+
+        l_df.append(spl.get_samples())
+
+    df_made, df_cached = l_df
+
+    _check_stats(df=df_made)
+    pnd.testing.assert_frame_equal(df_made, df_cached)
+# -------------------------------------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_Kee_eq_btosllball05_DPC'])
+@pytest.mark.parametrize('max_memory', [None, 1])
+def test_empty(sample : str, max_memory : int|None):
+    '''
+    Tests that a selection without candidates gives an empty sample with all the columns
+    '''
+    if sample.startswith('DATA_'):
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_ext'  , project='rx')
+    else:
+        rdf = _get_rdf(sample=sample, trigger='Hlt2RD_BuToKpEE_MVA_noPID', project='nopid')
+
+    uid     = rdf.uid
+    rdf     = rdf.Filter('false', 'empty')
+    rdf.uid = f'{uid}_empty'
+
+    cfg = _get_config()
+    cfg['max_memory'] = max_memory
+
+    spl = SampleSplitter(
+            rdf      = rdf,
+            sample   = sample,
+            hadron_id= 'kaon',
+            is_bplus = True,
+            cfg      = cfg,
+            name     = f'empty_{max_memory}')
+
+    df  = spl.get_samples()
+
+    assert len(df) == 0
+    assert {'block', 'hadron'} <= set(df.columns)
+    assert ('kind' in df.columns) == sample.startswith('DATA_')
+# -------------------------------------------------------
@@ -2,6 +2,7 @@
 Script holding functions needed to test SampleWeighter class
 '''
 import os
+import time
 from importlib.resources import files
 
 import yaml
@@ -9,6 +10,9 @@ import numpy
 import pytest
 import matplotlib.pyplot as plt
 import pandas            as pnd
+import pyarrow           as pa
+import pyarrow.dataset   as ds
+import pyarrow.parquet   as pq
 from dmu.logging.log_store    import LogStore
 from rx_misid.sample_weighter import SampleWeighter
 
@@ -136,3 +140,326 @@ def test_simple(is_sig : bool, sample : str):
     _validate_weights(df=df, mode=mode, sample=sample, lep='L1')
     _validate_weights(df=df, mode=mode, sample=sample, lep='L2')
 # ----------------------------
+@pytest.mark.parametrize('sample', [
+    'DATA_24_MagUp_24c2',
+    'Bu_JpsiK_ee_eq_DPC',
+    'Bu_piplpimnKpl_eq_sqDalitz_DPC'])
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_vectorized(is_sig : bool, sample : str):
+    '''
+    Checks that vectorized weighting gives the same weights as the per-candidate one
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.iloc[:5_000]
+
+    l_wgt = []
+    for vectorized in [True, False]:
+        wgt = SampleWeighter(
+                df    = df.copy(),
+                cfg   = cfg,
+                sample= sample,
+                is_sig= is_sig)
+
+        df_wgt = wgt.get_weighted_data(vectorized=vectorized)
+        l_wgt.append(df_wgt['weight'].to_numpy())
+
+    arr_vec, arr_row = l_wgt
+
+    assert numpy.allclose(arr_vec, arr_row, rtol=1e-12, atol=0)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['Bu_JpsiK_ee_eq_DPC', 'Bu_Kee_eq_btosllball05_DPC'])
+def test_missing_branch(sample : str):
+    '''
+    Checks that weighting true electron samples fails early when branches needed by the region cuts are missing
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.drop(columns=['L2_PID_E'])
+
+    with pytest.raises(ValueError):
+        SampleWeighter(
+                df    = df,
+                cfg   = cfg,
+                sample= sample,
+                is_sig= True)
+# ----------------------------
+@pytest.mark.parametrize('vectorized', [True, False])
+def test_nan_coordinate(vectorized : bool):
+    '''
+    Checks that both the vectorized and per-candidate weighting fail when a coordinate is NaN
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.iloc[:1_000].copy()
+    df.loc[df.index[0], 'L1_TRACK_ETA'] = numpy.nan
+
+    wgt = SampleWeighter(
+            df    = df,
+            cfg   = cfg,
+            sample= 'DATA_24_MagUp_24c2',
+            is_sig= True)
+
+    with pytest.raises(ValueError, match='NaN'):
+        wgt.get_weighted_data(vectorized=vectorized)
+# ----------------------------
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_block_subset(is_sig : bool):
+    '''
+    Checks that weighting a dataframe with a subset of blocks and hadrons, i.e. loading
+    only the maps needed, gives the same weights as weighting the full dataframe
+    '''
+    sample = 'DATA_24_MagUp_24c2'
+    cfg    = _get_config()
+    df     = _get_dataframe()
+    mask   = df['block'].isin([1, 2]) & (df['hadron'] == 'kaon')
+
+    wgt    = SampleWeighter(df=df.copy(), cfg=cfg, sample=sample, is_sig=is_sig)
+    df_all = wgt.get_weighted_data()
+
+    wgt    = SampleWeighter(df=df[mask].copy(), cfg=cfg, sample=sample, is_sig=is_sig)
+    df_sub = wgt.get_weighted_data()
+
+    arr_all = df_all[mask]['weight'].to_numpy()
+    arr_sub = df_sub['weight'].to_numpy()
+
+    assert numpy.allclose(arr_all, arr_sub, rtol=1e-12, atol=0)
+# ----------------------------
+def test_bin_index_cache():
+    '''
+    Checks that cached bin indices are only reused for the same candidates
+    '''
+    cfg  = _get_config()
+    df   = _get_dataframe()
+    wgt  = SampleWeighter(df=df, cfg=cfg, sample='DATA_24_MagUp_24c2', is_sig=True)
+    name = 'L1_TRACK_ETA'
+    emap = wgt._d_map['block1_kaon_signal']         # pylint: disable=protected-access
+    where= 1, 'kaon', 'signal'
+
+    arr_val = df[name].to_numpy(dtype=float)
+    for arr_row in [numpy.arange(0, 100), numpy.arange(100, 200)]:
+        arr_idx = wgt._get_bin_indices(emap, iaxis=1, arr_value=arr_val[arr_row], arr_row=arr_row, name=name, where=where) # pylint: disable=protected-access
+        arr_exp = [ wgt._get_bin_index(emap, iaxis=1, value=value, name=name, where=where) for value in arr_val[arr_row] ] # pylint: disable=protected-access
+
+        assert numpy.array_equal(arr_idx, arr_exp)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_JpsiK_ee_eq_DPC'])
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_streaming(is_sig : bool, sample : str):
+    '''
+    Checks that weighting a parquet file in chunks gives the same weights as weighting it in memory
+    '''
+    cfg      = _get_config()
+    df       = _get_dataframe()
+    inp_path = f'{Data.out_dir}/streaming_input.parquet'
+    out_path = f'{Data.out_dir}/streaming_{sample}_{is_sig}.parquet'
+    df.to_parquet(inp_path, row_group_size=10_000)
+
+    nentries = SampleWeighter.weight_parquet(
+            inp_path  = inp_path,
+            out_path  = out_path,
+            cfg       = cfg,
+            sample    = sample,
+            is_sig    = is_sig,
+            batch_size= 7_000)
+
+    wgt      = SampleWeighter(df=df, cfg=cfg, sample=sample, is_sig=is_sig)
+    df_mem   = wgt.get_weighted_data()
+    df_str   = pnd.read_parquet(out_path)
+
+    assert nentries == len(df_mem)
+    assert numpy.allclose(df_mem['weight'].to_numpy(), df_str['weight'].to_numpy(), rtol=1e-12, atol=0)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_JpsiK_ee_eq_DPC'])
+def test_streaming_empty(sample : str):
+    '''
+    Checks that weighting an empty parquet file gives an output with the same columns
+    as weighting one with entries
+    '''
+    cfg             = _get_config()
+    cfg['variants'] = {'nominal' : {'path' : cfg['path']}}
+    df              = _get_dataframe()
+
+    d_schema = {}
+    for kind, df_inp in [('full', df), ('empty', df.iloc[:0])]:
+        inp_path = f'{Data.out_dir}/streaming_{kind}_input.parquet'
+        out_path = f'{Data.out_dir}/streaming_{kind}_{sample}.parquet'
+        df_inp.to_parquet(inp_path, index=False)
+
+        SampleWeighter.weight_parquet(
+                inp_path  = inp_path,
+                out_path  = out_path,
+                cfg       = cfg,
+                sample    = sample,
+                is_sig    = True)
+
+        d_schema[kind] = pq.read_schema(out_path)
+
+    assert 'weight_nominal' in d_schema['empty'].names
+    assert d_schema['empty'].equals(d_schema['full'], check_metadata=False)
+# ----------------------------
+def test_output_extension():
+    '''
+    Checks that outputs without parquet extension are rejected, the anomalies would overwrite them
+    '''
+    with pytest.raises(ValueError, match='parquet extension'):
+        SampleWeighter.weight_parquet(
+                inp_path  = f'{Data.out_dir}/streaming_input.parquet',
+                out_path  = f'{Data.out_dir}/streaming_output',
+                cfg       = _get_config(),
+                sample    = 'DATA_24_MagUp_24c2',
+                is_sig    = True,
+                anomalies = True)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_JpsiK_ee_eq_DPC'])
+def test_partitioned(sample : str):
+    '''
+    Checks that weighting a partitioned dataset reads only the requested columns and partitions
+    '''
+    cfg      = _get_config()
+    df       = _get_dataframe()
+    df['idx']= numpy.arange(len(df))
+    df['B_M']= numpy.random.uniform(4500, 6000, size=len(df))
+
+    inp_path = f'{Data.out_dir}/partitioned_input'
+    out_path = f'{Data.out_dir}/partitioned_{sample}.parquet'
+    table    = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(table, inp_path, format='parquet', partitioning=['kind', 'block'], partitioning_flavor='hive', existing_data_behavior='delete_matching')
+
+    SampleWeighter.weight_parquet(
+            inp_path  = inp_path,
+            out_path  = out_path,
+            cfg       = cfg,
+            sample    = sample,
+            is_sig    = True,
+            columns   = ['idx'],
+            kinds     = ['FailFail'],
+            blocks    = [1, 2])
+
+    df_str   = pnd.read_parquet(out_path).sort_values('idx')
+    df_sel   = df[ (df['kind'] == 'FailFail') & df['block'].isin([1, 2]) ]
+
+    wgt      = SampleWeighter(df=df_sel.copy(), cfg=cfg, sample=sample, is_sig=True)
+    df_mem   = wgt.get_weighted_data()
+
+    assert 'B_M' not in df_str.columns
+    assert numpy.array_equal(df_str['idx'].to_numpy(), df_mem['idx'].to_numpy())
+    assert numpy.allclose(df_mem['weight'].to_numpy(), df_str['weight'].to_numpy(), rtol=1e-12, atol=0)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_piplpimnKpl_eq_sqDalitz_DPC'])
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_anomalies(is_sig : bool, sample : str):
+    '''
+    Checks that vectorized weighting counts the same anomalies as the per-candidate one
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.iloc[:5_000]
+
+    l_df_anm = []
+    for vectorized in [True, False]:
+        wgt = SampleWeighter(
+                df    = df.copy(),
+                cfg   = cfg,
+                sample= sample,
+                is_sig= is_sig)
+
+        wgt.get_weighted_data(vectorized=vectorized)
+        l_df_anm.append(wgt.get_anomalies())
+
+    df_vec, df_row = l_df_anm
+    log.info(df_vec)
+
+    assert df_vec.equals(df_row)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_piplpimnKpl_eq_sqDalitz_DPC', 'Bu_JpsiK_ee_eq_DPC'])
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_toys(is_sig : bool, sample : str):
+    '''
+    Checks that toy weights have the right shape, are reproducible, average to the nominal weights
+    and do not change them
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.iloc[:5_000]
+
+    wgt = SampleWeighter(
+            df    = df.copy(),
+            cfg   = cfg,
+            sample= sample,
+            is_sig= is_sig)
+
+    arr_toy_1 = wgt.get_toy_weights(ntoys=20, seed=1)
+    arr_toy_2 = wgt.get_toy_weights(ntoys=20, seed=1)
+    df_nom    = wgt.get_weighted_data()
+
+    ref = SampleWeighter(
+            df    = df.copy(),
+            cfg   = cfg,
+            sample= sample,
+            is_sig= is_sig)
+    df_ref = ref.get_weighted_data()
+
+    assert arr_toy_1.shape == (20, len(df))
+    assert numpy.array_equal(arr_toy_1, arr_toy_2)
+    assert numpy.allclose(df_nom['weight'], df_ref['weight'])
+    assert wgt.get_anomalies().equals(ref.get_anomalies())
+
+    # For data, weights are ratios of efficiencies and their mean over toys is biased
+    if not sample.startswith('DATA_'):
+        arr_toy = wgt.get_toy_weights(ntoys=200, seed=2)
+        assert numpy.isclose(arr_toy.mean(axis=0).sum(), df_nom['weight'].sum(), rtol=0.02)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['Bu_piplpimnKpl_eq_sqDalitz_DPC', 'Bu_JpsiK_ee_eq_DPC'])
+def test_benchmark(sample : str):
+    '''
+    Compares time needed to weight MC with vectorized and per-candidate calculations
+    '''
+    cfg = _get_config()
+    df  = _get_dataframe()
+    df  = df.iloc[:10_000]
+
+    d_time = {}
+    d_wgt  = {}
+    for vectorized in [True, False]:
+        wgt   = SampleWeighter(df=df.copy(), cfg=cfg, sample=sample, is_sig=False)
+        start = time.perf_counter()
+        df_wgt= wgt.get_weighted_data(vectorized=vectorized)
+        d_time[vectorized] = time.perf_counter() - start
+        d_wgt[vectorized]  = df_wgt['weight'].to_numpy()
+
+    speedup = d_time[False] / d_time[True]
+    log.info(f'Vectorized: {d_time[True]:.3f} s, per candidate: {d_time[False]:.3f} s, speedup: {speedup:.0f}')
+
+    assert numpy.allclose(d_wgt[True], d_wgt[False], rtol=1e-12, atol=0)
+# ----------------------------
+@pytest.mark.parametrize('sample', ['DATA_24_MagUp_24c2', 'Bu_piplpimnKpl_eq_sqDalitz_DPC', 'Bu_JpsiK_ee_eq_DPC'])
+@pytest.mark.parametrize('is_sig', [True, False])
+def test_variants(is_sig : bool, sample : str):
+    '''
+    Checks that a variant identical to the nominal configuration gives the nominal weights
+    and that a variant with different regions is evaluated for true electrons
+    '''
+    cfg             = _get_config()
+    cfg['variants'] = {'nominal' : {'path' : cfg['path']}}
+    if sample == 'Bu_JpsiK_ee_eq_DPC':
+        cfg['variants']['tight'] = {'regions' : {
+            'control' : '(PROBNN_E<0.5|DLLe<3.0)&(DLLe>-1.0)',
+            'signal'  : '(PROBNN_E>0.5)&(DLLe>3.0)'}}
+
+    df  = _get_dataframe()
+    df  = df.iloc[:5_000]
+
+    wgt = SampleWeighter(
+            df    = df,
+            cfg   = cfg,
+            sample= sample,
+            is_sig= is_sig)
+
+    df  = wgt.get_weighted_data()
+
+    assert numpy.allclose(df['weight'], df['weight_nominal'])
+    if 'tight' in cfg['variants']:
+        assert 'weight_tight' in df.columns
+        assert not numpy.allclose(df['weight'], df['weight_tight'])
+# ----------------------------
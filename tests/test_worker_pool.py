@@ -0,0 +1,105 @@
+'''
+Module with functions meant to test WorkerPool class
+'''
+import os
+import multiprocessing
+
+import numpy
+import pytest
+
+from dmu.logging.log_store   import LogStore
+from dmu.workflow.cache      import Cache as Wcache
+from rx_misid.map_repository import MapRepository
+from rx_misid.worker_pool    import WorkerPool
+
+log=LogStore.add_logger('rx_misid:test_worker_pool')
+# -------------------------------------------------------
+class Data:
+    '''
+    Data class
+    '''
+    out_dir = '/tmp/tests/rx_misid/worker_pool'
+# -------------------------------------------------------
+@pytest.fixture(scope='session', autouse=True)
+def _initialize():
+    LogStore.set_level('rx_misid:worker_pool', 10)
+    os.makedirs(Data.out_dir, exist_ok=True)
+
+    yield
+
+    WorkerPool.shutdown()
+# -------------------------------------------------------
+def _get_sum(path : str) -> tuple[int,float]:
+    emap = MapRepository.get_map(path=path)
+
+    return os.getpid(), float(emap.values.sum())
+# -------------------------------------------------------
+def test_reuse(make_map):
+    '''
+    Tests that the same workers are used across calls and that maps
+    not shared when the pool was made can still be used
+    '''
+    l_path = [ make_map(Data.out_dir, name=f'map_{index}', value=0.1 * index) for index in range(4) ]
+    l_sum  = [ _get_sum(path)[1] for path in l_path ]
+
+    pool_1 = WorkerPool.get(nproc=2, l_path=l_path[:2])
+    l_res_1= pool_1.map(_get_sum, l_path)
+    s_wrk_1= { proc.pid for proc in multiprocessing.active_children() }
+
+    pool_2 = WorkerPool.get(nproc=1, l_path=l_path[:1])
+    l_res_2= pool_2.map(_get_sum, l_path)
+    s_wrk_2= { proc.pid for proc in multiprocessing.active_children() }
+
+    assert pool_1 is pool_2
+    assert numpy.allclose(l_sum, [ val for _, val in l_res_1 ])
+    assert numpy.allclose(l_sum, [ val for _, val in l_res_2 ])
+
+    s_pid   = { pid for pid, _ in l_res_1 + l_res_2 }
+    assert s_wrk_1 == s_wrk_2
+    assert s_pid   <= s_wrk_1
+# -------------------------------------------------------
+def test_resize(make_map):
+    '''
+    Tests that the pool is replaced when more processes are needed
+    '''
+    path   = make_map(Data.out_dir, name='resize', value=0.5)
+
+    pool_1 = WorkerPool.get(nproc=1, l_path=[path])
+    pool_2 = WorkerPool.get(nproc=3, l_path=[path])
+
+    assert pool_1 is not pool_2
+
+    _, val = pool_2.apply(_get_sum, (path,))
+    assert numpy.isclose(val, 3.0)
+# -------------------------------------------------------
+def _get_skipped(_) -> list[str]|None:
+    return Wcache._l_skip_class # pylint: disable=protected-access
+# -------------------------------------------------------
+def test_new_maps(make_map):
+    '''
+    Tests that the pool is replaced when maps not shared with it are needed
+    '''
+    l_path = [ make_map(Data.out_dir, name=f'new_{index}', value=0.1 * index) for index in range(2) ]
+
+    pool_1 = WorkerPool.get(nproc=2, l_path=l_path[:1])
+    pool_2 = WorkerPool.get(nproc=2, l_path=l_path)
+    pool_3 = WorkerPool.get(nproc=2, l_path=l_path[1:])
+
+    assert pool_1 is not pool_2
+    assert pool_2 is pool_3
+# -------------------------------------------------------
+def test_settings():
+    '''
+    Tests that the pool is replaced when the settings copied by the workers change
+    '''
+    pool_1 = WorkerPool.get(nproc=2, l_path=[])
+    with Wcache.turn_off_cache(val=['MisIDCalculator']):
+        pool_2 = WorkerPool.get(nproc=2, l_path=[])
+        l_skip = pool_2.map(_get_skipped, range(2))
+
+    pool_3 = WorkerPool.get(nproc=2, l_path=[])
+
+    assert pool_1 is not pool_2
+    assert pool_2 is not pool_3
+    assert l_skip == [['MisIDCalculator'], ['MisIDCalculator']]
+# -------------------------------------------------------